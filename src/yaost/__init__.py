@@ -1,3 +1,4 @@
+from .base import interned  # noqa
 from .body import *  # noqa
 from .local_logging import get_logger  # noqa
 from .path import Path  # noqa
@@ -0,0 +1,111 @@
+"""Affine transformation matrices.
+
+Matrix is a tuple of three rows with four elements each, last row of
+full 4x4 matrix is always [0, 0, 0, 1]. Semantics of every matrix
+follows corresponding OpenSCAD transformation.
+"""
+from math import cos, pi, sin
+from numbers import Real
+from typing import Tuple
+
+from yaost.vector import Vector
+
+Matrix = Tuple[Tuple[float, float, float, float], ...]
+
+IDENTITY: Matrix = (
+    (1.0, 0.0, 0.0, 0.0),
+    (0.0, 1.0, 0.0, 0.0),
+    (0.0, 0.0, 1.0, 0.0),
+)
+
+
+def is_numeric(*values) -> bool:
+    """False when some of vectors or matrix rows holds a variable or other symbol."""
+    for value in values:
+        if isinstance(value, Vector):
+            value = (value.x, value.y, value.z)
+        if not all(isinstance(item, Real) for item in value):
+            return False
+    return True
+
+
+def translation(v: Vector) -> Matrix:
+    return (
+        (1.0, 0.0, 0.0, v.x),
+        (0.0, 1.0, 0.0, v.y),
+        (0.0, 0.0, 1.0, v.z),
+    )
+
+
+def scaling(v: Vector) -> Matrix:
+    return (
+        (v.x, 0.0, 0.0, 0.0),
+        (0.0, v.y, 0.0, 0.0),
+        (0.0, 0.0, v.z, 0.0),
+    )
+
+
+def _cos_sin(angle: float) -> Tuple[float, float]:
+    # exact values for right angles keep matrices clean
+    if angle % 90 == 0:
+        return ((1, 0), (0, 1), (-1, 0), (0, -1))[int(angle // 90) % 4]
+    radians = angle * pi / 180
+    return cos(radians), sin(radians)
+
+
+def rotation(v: Vector) -> Matrix:
+    """Rotation around x, then y, then z axis, same as rotate([x, y, z])."""
+    cx, sx = _cos_sin(v.x)
+    cy, sy = _cos_sin(v.y)
+    cz, sz = _cos_sin(v.z)
+    return (
+        (cz * cy, cz * sy * sx - sz * cx, cz * sy * cx + sz * sx, 0.0),
+        (sz * cy, sz * sy * sx + cz * cx, sz * sy * cx - cz * sx, 0.0),
+        (-sy, cy * sx, cy * cx, 0.0),
+    )
+
+
+def mirroring(v: Vector) -> Matrix:
+    """Reflection in the plane through origin with normal v, same as mirror(v)."""
+    norm2 = v.x * v.x + v.y * v.y + v.z * v.z
+    if not norm2:
+        return IDENTITY
+    n = (v.x, v.y, v.z)
+    return tuple(
+        tuple((1.0 if i == j else 0.0) - 2 * n[i] * n[j] / norm2 for j in range(3)) + (0.0,)
+        for i in range(3)
+    )
+
+
+def centered(matrix: Matrix, center: Vector) -> Matrix:
+    """Same transformation applied around center instead of origin."""
+    if not center:
+        return matrix
+    return multiply(translation(center), multiply(matrix, translation(-center)))
+
+
+def multiply(a: Matrix, b: Matrix) -> Matrix:
+    """Returns a * b, transformation b is applied first."""
+    return tuple(
+        tuple(a[i][0] * b[0][j] + a[i][1] * b[1][j] + a[i][2] * b[2][j] for j in range(4))[:3]
+        + (a[i][0] * b[0][3] + a[i][1] * b[1][3] + a[i][2] * b[2][3] + a[i][3],)
+        for i in range(3)
+    )
+
+
+def apply(matrix: Matrix, v: Vector) -> Vector:
+    return Vector(
+        matrix[0][0] * v.x + matrix[0][1] * v.y + matrix[0][2] * v.z + matrix[0][3],
+        matrix[1][0] * v.x + matrix[1][1] * v.y + matrix[1][2] * v.z + matrix[1][3],
+        matrix[2][0] * v.x + matrix[2][1] * v.y + matrix[2][2] * v.z + matrix[2][3],
+    )
+
+
+def is_translation(matrix: Matrix) -> bool:
+    return all(matrix[i][j] == IDENTITY[i][j] for i in range(3) for j in range(3))
+
+
+def as_list(matrix: Matrix) -> list:
+    """Full 4x4 matrix as argument of multmatrix()."""
+    # NOTE rounding drops noise of composed rotations, adding zero turns -0.0 into 0.0
+    return [[round(v, 12) + 0.0 for v in row] for row in matrix] + [[0, 0, 0, 1]]
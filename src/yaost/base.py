@@ -1,4 +1,5 @@
 # coding: utf-8
+import copy
 import logging
 from typing import Optional
 from typing import Union as TUnion
@@ -6,57 +7,141 @@ from typing import Union as TUnion
 import yaost.context as ctx
 from yaost.bbox import BBox
 from yaost.context import Operation
+from yaost.traversal import cache_bottom_up, find_path, iter_postorder, run_steps
 from yaost.vector import Vector
 
 logger = logging.getLogger(__name__)
 
 
+def interned(node, table: dict):
+    """Node from table structurally equal to the given one.
+
+    Table is a plain dict owned by the caller, the node is added to it
+    when there is no equal one yet, so equal constructions passed through
+    the same table become the same instance. Labelled nodes are never
+    interned. Interned nodes are shared, so they should not be modified.
+    """
+    if node.label is not None:
+        return node
+    return table.setdefault((type(node), node.structural_key), node)
+
+
+_DERIVED_CACHES = ('_affine_chain', '_collapsed', '_leaf_stats', '_subtree_index')
+_NO_LABELS: dict = {}
+
+
+def _tree_children(node) -> tuple:
+    return node._tree_children()
+
+
+def _build_subtree_index(node) -> tuple:
+    body = node if node.is_body else None
+    tables = []
+    if node.label is not None:
+        tables.append({node.label: node})
+
+    for child in node._tree_children():
+        child_body, child_labels = child.__dict__['_subtree_index']
+        if body is None:
+            body = child_body
+        if child_labels:
+            tables.append(child_labels)
+
+    if not tables:
+        return body, _NO_LABELS
+    if len(tables) == 1:
+        # NOTE tables are never modified, so they are shared along chains
+        return body, tables[0]
+    labels = {}
+    for table in reversed(tables):
+        labels.update(table)
+    return body, labels
+
+
 class BaseObject:
     origin = Vector()
-    bbox = BBox()
+    bbox = BBox.unknown()
     label: Optional[str] = None
     is_body: bool = False
     is_2d = False
+    _structural_key: Optional[str] = None
 
     def to_scad(self):
         raise NotImplementedError
 
-    def traverse_all(self):
-        from yaost.transformation import (
-            MultipleChildrenTransformation,
-            SingleChildTransformation,
-        )
+    def _scad_parts(self):
+        """Scad code as a sequence of strings and child nodes."""
+        return (self.to_scad(),)
 
-        if isinstance(self, MultipleChildrenTransformation):
-            for child in self.children:
-                for subchild in child.traverse_all():
-                    yield subchild
-        elif isinstance(self, SingleChildTransformation):
-            for subchild in self.child.traverse_all():
-                yield subchild
-        yield self
+    @property
+    def structural_key(self) -> str:
+        """Canonical key, equal for nodes producing the same scad code."""
+        from yaost.serializer import structural_key
+
+        return structural_key(self)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, BaseObject):
+            return NotImplemented
+        return self.structural_key == other.structural_key
+
+    def __hash__(self):
+        return hash(self.structural_key)
+
+    def write_scad(self, fp, modules: bool = False, multmatrix: bool = False, simplify: bool = False):
+        from yaost.serializer import write_scad
+
+        write_scad(self, fp, modules=modules, multmatrix=multmatrix, simplify=simplify)
+
+    def _tree_children(self) -> tuple:
+        return ()
+
+    def _with_children(self, children) -> 'BaseObject':
+        """Shallow copy of node with another tree children."""
+        return self
+
+    def _copy(self) -> 'BaseObject':
+        """Shallow copy without cached values derived from children."""
+        result = copy.copy(self)
+        result._structural_key = None
+        for key in _DERIVED_CACHES:
+            result.__dict__.pop(key, None)
+        return result
+
+    def _get_subtree_index(self) -> tuple:
+        """First body and first node for every label of subtree in preorder.
+
+        Index is built on first lookup from indexes of children and cached,
+        so wrapping a node with a new transformation costs constant time.
+        Nodes should not be relabelled after they were looked up.
+        """
+        return cache_bottom_up(self, '_subtree_index', _build_subtree_index, _tree_children)
+
+    def _find_body(self) -> Optional['BaseObject']:
+        return self._get_subtree_index()[0]
+
+    def _find_label(self, label: str) -> Optional['BaseObject']:
+        return self._get_subtree_index()[1].get(label)
+
+    def _affine_matrix(self):
+        """Matrix of node if it is a plain affine transformation of its child."""
+        return None
+
+    def _bbox_points(self):
+        """Points whose box is the box of node, when node has them."""
+        return None
+
+    def traverse_all(self):
+        return iter_postorder(self)
 
     def _get_body_stack(self, label: Optional[str] = None):
-        from yaost.transformation import (
-            MultipleChildrenTransformation,
-            SingleChildTransformation,
+        return find_path(
+            self,
+            lambda node: node.is_body and (label is None or label == node.label),
         )
 
-        if self.is_body and (label is None or label == self.label):
-            return [self]
-
-        result = None
-        if isinstance(self, MultipleChildrenTransformation):
-            for child in self.children:
-                result = child._get_body_stack(label)
-                if result:
-                    break
-        elif isinstance(self, SingleChildTransformation):
-            result = self.child._get_body_stack(label)
-        if result is None:
-            return result
-        return result + [self]
-
     def solids(self):
         yield self
 
@@ -65,7 +150,25 @@ class BaseObject:
         yield self
 
     def collapse(self, *classes_to_collapse):
-        yield self
+        """Iterates flattened subtree, result is computed once per classes."""
+        cache = self.__dict__.setdefault('_collapsed', {})
+        result = cache.get(classes_to_collapse)
+        if result is None:
+            result = cache[classes_to_collapse] = tuple(run_steps(self._collapse_steps(classes_to_collapse)))
+        return iter(result)
+
+    def _collapse_step(self, classes_to_collapse):
+        """Step of collapse for parents: cached result as a fresh list if any."""
+        cache = self.__dict__.get('_collapsed')
+        if cache is not None:
+            result = cache.get(classes_to_collapse)
+            if result is not None:
+                return list(result)
+        return self._collapse_steps(classes_to_collapse)
+
+    def _collapse_steps(self, classes_to_collapse):
+        return [self]
+        yield
 
     def same_moves(
         self,
@@ -1,8 +1,21 @@
 import typing
+from itertools import product
+
 from yaost.vector import Vector
 
+INF = float('inf')
+
 
 class BBox:
+    """Immutable axis aligned bounding box.
+
+    Besides usual boxes there are two special ones: unknown box spans
+    the whole space and is used for shapes whose extent can not be
+    computed, empty box has vmin greater than vmax and contains nothing.
+    """
+
+    __slots__ = ('vmin', 'vmax')
+
     def __init__(
         self,
         vmin: typing.Optional[Vector] = None,
@@ -13,8 +26,70 @@ class BBox:
         if vmax is None:
             vmax = Vector()
 
-        self.vmin = vmin
-        self.vmax = vmax
+        object.__setattr__(self, 'vmin', vmin)
+        object.__setattr__(self, 'vmax', vmax)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self):
+        return (BBox, (self.vmin, self.vmax))
+
+    @classmethod
+    def unknown(cls) -> 'BBox':
+        return cls(Vector(-INF, -INF, -INF), Vector(INF, INF, INF))
+
+    @classmethod
+    def empty(cls) -> 'BBox':
+        return cls(Vector(INF, INF, INF), Vector(-INF, -INF, -INF))
+
+    @classmethod
+    def from_points(cls, points: typing.Iterable) -> 'BBox':
+        """Box of points given as vectors or [x, y] and [x, y, z] sequences."""
+        if hasattr(points, 'tolist'):
+            points = points.tolist()
+        xs, ys, zs = [], [], []
+        for p in points:
+            if isinstance(p, Vector):
+                xs.append(p.x)
+                ys.append(p.y)
+                zs.append(p.z)
+                continue
+            xs.append(p[0])
+            ys.append(p[1])
+            zs.append(p[2] if len(p) > 2 else 0)
+        if not xs:
+            return cls.empty()
+        return cls(Vector(min(xs), min(ys), min(zs)), Vector(max(xs), max(ys), max(zs)))
+
+    @property
+    def is_unknown(self) -> bool:
+        return -INF in (self.vmin.x, self.vmin.y, self.vmin.z) or INF in (self.vmax.x, self.vmax.y, self.vmax.z)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.vmin.x > self.vmax.x or self.vmin.y > self.vmax.y or self.vmin.z > self.vmax.z
+
+    @property
+    def size(self) -> Vector:
+        return self.vmax - self.vmin
+
+    @property
+    def center(self) -> Vector:
+        return (self.vmin + self.vmax) / 2
+
+    def corners(self) -> typing.List[Vector]:
+        return [
+            Vector(x, y, z)
+            for x, y, z in product(
+                (self.vmin.x, self.vmax.x),
+                (self.vmin.y, self.vmax.y),
+                (self.vmin.z, self.vmax.z),
+            )
+        ]
 
     @classmethod
     def _new_order(self, v1: Vector, v2: Vector):
@@ -45,15 +120,78 @@ class BBox:
         )
         return BBox(vmin, vmax)
 
+    def transform(self, matrix) -> 'BBox':
+        """Box of this box transformed with affine matrix."""
+        from yaost.affine import apply
+
+        if self.is_empty or self.is_unknown:
+            return self
+        return BBox.from_points(apply(matrix, corner) for corner in self.corners())
+
+    def union(self, *others: 'BBox') -> 'BBox':
+        vmin, vmax = self.vmin, self.vmax
+        for other in others:
+            vmin = Vector(min(vmin.x, other.vmin.x), min(vmin.y, other.vmin.y), min(vmin.z, other.vmin.z))
+            vmax = Vector(max(vmax.x, other.vmax.x), max(vmax.y, other.vmax.y), max(vmax.z, other.vmax.z))
+        return BBox(vmin, vmax)
+
+    def intersection(self, *others: 'BBox') -> 'BBox':
+        vmin, vmax = self.vmin, self.vmax
+        for other in others:
+            vmin = Vector(max(vmin.x, other.vmin.x), max(vmin.y, other.vmin.y), max(vmin.z, other.vmin.z))
+            vmax = Vector(min(vmax.x, other.vmax.x), min(vmax.y, other.vmax.y), min(vmax.z, other.vmax.z))
+        result = BBox(vmin, vmax)
+        if result.is_empty:
+            return BBox.empty()
+        return result
+
+    def overlaps(self, other: 'BBox', eps: float = 0) -> bool:
+        """False only when boxes are apart by more than eps along some axis."""
+        if self.is_empty or other.is_empty:
+            return False
+        return not (
+            self.vmin.x > other.vmax.x + eps
+            or self.vmin.y > other.vmax.y + eps
+            or self.vmin.z > other.vmax.z + eps
+            or other.vmin.x > self.vmax.x + eps
+            or other.vmin.y > self.vmax.y + eps
+            or other.vmin.z > self.vmax.z + eps
+        )
+
+    def __or__(self, other: 'BBox') -> 'BBox':
+        return self.union(other)
+
+    def __and__(self, other: 'BBox') -> 'BBox':
+        return self.intersection(other)
+
+    def __eq__(self, other):
+        if not isinstance(other, BBox):
+            return NotImplemented
+        if self.is_empty or other.is_empty:
+            return self.is_empty and other.is_empty
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        # all empty boxes are equal
+        if self.is_empty:
+            return hash(BBox)
+        return hash(self.as_tuple())
+
+    def as_tuple(self) -> tuple:
+        return (self.vmin.x, self.vmin.y, self.vmin.z, self.vmax.x, self.vmax.y, self.vmax.z)
+
+    def __repr__(self):
+        return f'BBox({self.vmin}, {self.vmax})'
+
     def __add__(self, other):
         if isinstance(other, Vector):
+            if self.is_empty:
+                return self
             return BBox(
                 self.vmin + other,
                 self.vmax + other,
             )
         elif isinstance(other, BBox):
-            return BBox(self.vmin, self.vmax)
+            return self.union(other)
         else:
             raise RuntimeError(f'Unknown type `{type(other)}`')
-
-
@@ -34,10 +34,16 @@ class Group(BaseBody):
         label: Optional[str] = None,
     ):
         self.label = label
-        self.bbox = child.bbox
         self.origin = child.origin
         self.child = child
 
+    @lazy
+    def bbox(self):
+        return self.child.bbox
+
+    def _scad_parts(self):
+        return (self.child,)
+
     def to_scad(self) -> str:
         return self.child.to_scad()
 
@@ -46,6 +52,18 @@ class Group(BaseBody):
         return self.child.is_2d
 
 
+class Empty(BaseObject):
+    """Nothing, result of operations known to produce no geometry."""
+
+    bbox = BBox.empty()
+
+    def _scad_parts(self):
+        return ()
+
+    def to_scad(self) -> str:
+        return ''
+
+
 class Cube(BaseBody):
     def __init__(
         self,
@@ -61,6 +79,9 @@ class Cube(BaseBody):
         self.bbox = BBox(Vector(), Vector(x, y, z))
         self.label = label
 
+    def _bbox_points(self):
+        return self.bbox.corners()
+
     def to_scad(self):
         return 'cube({});'.format(full_arguments_line([[self.x, self.y, self.z]]))
 
@@ -191,9 +212,52 @@ class GenericBody(BaseBody):
         self._args = args
         self._kwargs = kwargs
         self._name = name
+        self.label = label
 
         self.origin = Vector()
-        self.bbox = BBox()
+
+    @lazy
+    def bbox(self):
+        points = self._bbox_points()
+        if points is not None:
+            return BBox.from_points(points)
+
+        if self._name in ('sphere', 'circle'):
+            r = self._kwargs.get('r', self._args[0] if self._args else None)
+            if r is None and isinstance(self._kwargs.get('d'), (int, float)):
+                r = self._kwargs['d'] / 2
+            if isinstance(r, (int, float)):
+                rz = r if self._name == 'sphere' else 0
+                return BBox(Vector(-r, -r, -rz), Vector(r, r, rz))
+
+        if self._name == 'square':
+            size = self._kwargs.get('size', self._args[0] if self._args else 1)
+            if isinstance(size, (int, float)):
+                size = (size, size)
+            if isinstance(size, (list, tuple)) and len(size) == 2:
+                result = BBox(Vector(), Vector(size[0], size[1]))
+                if self._kwargs.get('center'):
+                    result += -result.center
+                return result
+
+        return BBox.unknown()
+
+    @lazy
+    def _points(self):
+        if self._name not in ('polygon', 'polyhedron'):
+            return None
+        points = self._args[0] if self._args else self._kwargs.get('points')
+        if points is None:
+            return None
+        if hasattr(points, 'tolist'):
+            points = points.tolist()
+        return [
+            p if isinstance(p, Vector) else Vector(p[0], p[1], p[2] if len(p) > 2 else 0)
+            for p in points
+        ]
+
+    def _bbox_points(self):
+        return self._points
 
     def to_scad(self):
         return '{}({});'.format(
@@ -0,0 +1,262 @@
+"""Build caches.
+
+`BuildCache` remembers hashes of scad files and results built from them
+in sqlite database. Records of built parts are collected in memory
+during a build and written in a single transaction by `commit()`, so the
+database is never left with a half written build and concurrent builds
+only wait for each other's commits. Older json cache found at the same
+path is imported.
+
+`ArtifactStore` is a plain directory of rendered files addressed by
+their inputs, it can be shared between checkouts and build machines.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from typing import Dict, Optional
+
+from .local_logging import get_logger
+
+logger = get_logger(__name__)
+
+_SQLITE_HEADER = b'SQLite format 3\0'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scad_cache (
+    scad_file_path TEXT PRIMARY KEY,
+    scad_hash TEXT NOT NULL,
+    build_hash TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS part_fingerprints (
+    scad_file_path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    scad_hash TEXT NOT NULL,
+    is_2d INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+'''
+
+
+class BuildCache:
+    def __init__(self, path: str, timeout: float = 60.0):
+        self._path = path
+        self._timeout = timeout
+        self._records: Dict[str, dict] = {}
+        self._versions: Dict[str, int] = {}
+        self._file_hashes: Dict[str, tuple] = {}
+        self._fingerprints: Dict[str, tuple] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and not _is_sqlite(path):
+            self._import_json(path)
+        self._connection = self._connect(path)
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, timeout=self._timeout)
+        # readers do not block writer and writer does not block readers
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _import_json(self, path: str):
+        try:
+            with open(path, encoding='utf-8') as fp:
+                data = json.load(fp)
+        except Exception:  # noqa
+            logger.error('reading json cache failed', exc_info=True)
+            data = {}
+
+        # database is filled aside and moved over json file at once
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        connection = self._connect(temporary_path)
+        try:
+            with connection:
+                for scad_file_path, record in (data.get('scad_cache') or {}).items():
+                    if not isinstance(record, dict):
+                        continue
+                    connection.execute(
+                        'INSERT OR REPLACE INTO scad_cache VALUES (?, ?, ?, ?)',
+                        (
+                            scad_file_path,
+                            record.get('scad_hash', ''),
+                            record.get('build_hash', ''),
+                            record.get('version', 0),
+                        ),
+                    )
+                for name, project in (data.get('projects') or {}).items():
+                    if isinstance(project, dict) and 'version' in project:
+                        connection.execute('INSERT OR REPLACE INTO projects VALUES (?, ?)', (name, project['version']))
+            connection.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            connection.close()
+        os.replace(temporary_path, path)
+        logger.info('imported json cache %s', path)
+
+    def get_record(self, scad_file_path: str) -> Optional[dict]:
+        if scad_file_path in self._records:
+            return self._records[scad_file_path]
+        row = self._connection.execute(
+            'SELECT scad_hash, build_hash, version FROM scad_cache WHERE scad_file_path = ?',
+            (scad_file_path,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {'scad_hash': row[0], 'build_hash': row[1], 'version': row[2]}
+
+    def set_record(self, scad_file_path: str, scad_hash: str, build_hash: str, version: int):
+        self._records[scad_file_path] = {'scad_hash': scad_hash, 'build_hash': build_hash, 'version': version}
+
+    def get_version(self, project_name: str) -> int:
+        if project_name in self._versions:
+            return self._versions[project_name]
+        row = self._connection.execute('SELECT version FROM projects WHERE name = ?', (project_name,)).fetchone()
+        if row is None:
+            return 0
+        return row[0]
+
+    def set_version(self, project_name: str, version: int):
+        self._versions[project_name] = version
+
+    def get_file_hash(self, path: str, stat: tuple) -> Optional[str]:
+        """Hash remembered for file if its (size, mtime_ns, inode) did not change."""
+        if path in self._file_hashes:
+            cached = self._file_hashes[path]
+        else:
+            cached = self._connection.execute(
+                'SELECT size, mtime_ns, inode, hash FROM file_hashes WHERE path = ?',
+                (path,),
+            ).fetchone()
+        if cached is None or tuple(cached[:3]) != tuple(stat):
+            return None
+        return cached[3]
+
+    def set_file_hash(self, path: str, stat: tuple, file_hash: str):
+        self._file_hashes[path] = (*stat, file_hash)
+
+    def get_fingerprint(self, scad_file_path: str) -> Optional[tuple]:
+        """Fingerprint of part written to scad file, its scad hash and is_2d."""
+        if scad_file_path in self._fingerprints:
+            return self._fingerprints[scad_file_path]
+        row = self._connection.execute(
+            'SELECT fingerprint, scad_hash, is_2d FROM part_fingerprints WHERE scad_file_path = ?',
+            (scad_file_path,),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], bool(row[2])
+
+    def set_fingerprint(self, scad_file_path: str, fingerprint: str, scad_hash: str, is_2d: bool):
+        self._fingerprints[scad_file_path] = (fingerprint, scad_hash, is_2d)
+
+    def commit(self):
+        if not any((self._records, self._versions, self._file_hashes, self._fingerprints)):
+            return
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO scad_cache VALUES (?, ?, ?, ?)',
+                [
+                    (path, record['scad_hash'], record['build_hash'], record['version'])
+                    for path, record in self._records.items()
+                ],
+            )
+            self._connection.executemany('INSERT OR REPLACE INTO projects VALUES (?, ?)', self._versions.items())
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)',
+                [(path, *cached) for path, cached in self._file_hashes.items()],
+            )
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO part_fingerprints VALUES (?, ?, ?, ?)',
+                [(path, *fingerprint) for path, fingerprint in self._fingerprints.items()],
+            )
+        self._records.clear()
+        self._versions.clear()
+        self._file_hashes.clear()
+        self._fingerprints.clear()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self) -> 'BuildCache':
+        return self
+
+    def __exit__(self, *exc_info):
+        # records are set for finished parts only, so they are kept
+        # even when build is interrupted
+        try:
+            self.commit()
+        finally:
+            self.close()
+
+
+class ArtifactStore:
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    @staticmethod
+    def key(scad_hash: str, extension: str, openscad_version: str, flags=()) -> str:
+        h = hashlib.sha256()
+        for value in (scad_hash, extension, openscad_version, *flags):
+            h.update(value.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self._directory, key[:2], key + extension)
+
+    def fetch(self, key: str, extension: str, target_path: str) -> bool:
+        """Places stored artifact at target path, false if there is none."""
+        path = self._path(key, extension)
+        if not os.path.exists(path):
+            return False
+        try:
+            _place(path, target_path)
+        except OSError:
+            logger.error('fetching %s from artifact store failed', target_path, exc_info=True)
+            return False
+        return True
+
+    def store(self, key: str, extension: str, source_path: str):
+        path = self._path(key, extension)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _place(source_path, path)
+        except OSError:
+            logger.error('storing %s in artifact store failed', source_path, exc_info=True)
+
+
+def _place(source_path: str, target_path: str):
+    # hard link when possible, files placed are replaced and never
+    # written in place, so linked copies do not change each other
+    base, extension = os.path.splitext(target_path)
+    temporary_path = f'{base}.{uuid.uuid4().hex}.tmp{extension}'
+    try:
+        try:
+            os.link(source_path, temporary_path)
+        except OSError:
+            shutil.copyfile(source_path, temporary_path)
+        os.replace(temporary_path, target_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+
+
+def _is_sqlite(path: str) -> bool:
+    with open(path, 'rb') as fp:
+        return fp.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
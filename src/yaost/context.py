@@ -1,47 +1,18 @@
 # coding: utf-8
 from typing import Iterable
 
+from yaost.traversal import find_first
+
 
 class Operation(object):
     def __call__(self, node, **kwargs):
         raise NotImplementedError
 
     def _find_body(self, node):
-        from yaost.transformation import (
-            MultipleChildrenTransformation,
-            SingleChildTransformation,
-        )
-
-        if node.is_body:
-            return node
-
-        if isinstance(node, MultipleChildrenTransformation):
-            for child in node.children:
-                result = self._find_body(child)
-                if result is not None:
-                    return result
-        elif isinstance(node, SingleChildTransformation):
-            return self._find_body(node.child)
-        return None
+        return node._find_body()
 
     def _find_first(self, node, callback):
-        from yaost.transformation import (
-            MultipleChildrenTransformation,
-            SingleChildTransformation,
-        )
-
-        result = callback(node)
-        if result is not None:
-            return result
-
-        if isinstance(node, MultipleChildrenTransformation):
-            for child in node.children:
-                result = self._find_first(child, callback)
-                if result is not None:
-                    return result
-        elif isinstance(node, SingleChildTransformation):
-            return self._find_first(node.child, callback)
-        return None
+        return find_first(node, callback)
 
     def __add__(self, other):
         return BinaryOperation(self, other, operator=lambda x, y: x + y)
@@ -117,12 +88,7 @@ class NodeByLabel(Operation):
     def __call__(self, obj, **kwargs):
         label, path = self._path[0], self._path[1:]
 
-        def _filter(node):
-            if node.label == label:
-                return node
-            return None
-
-        result = self._find_first(obj, _filter)
+        result = obj._find_label(label)
         if result is None:
             raise RuntimeError('Could not find node')
 
@@ -169,30 +135,13 @@ class Inspector:
         self._obj = obj
 
     def get_body(self):
-        obj = self._find_first(self._obj, lambda x: x.is_obj)
-        return obj
+        return self._obj._find_body()
 
     def get_by_label(self, label: str):
-        obj = self._find_first(self._obj, lambda x: x.label == label)
-        return obj
+        return self._obj._find_label(label)
 
     def _find_first(self, obj, filter_function):
-        from yaost.transformation import (
-            MultipleChildrenTransformation,
-            SingleChildTransformation,
-        )
-
-        if filter_function(obj):
-            return obj
-
-        if isinstance(obj, MultipleChildrenTransformation):
-            for child in obj.children:
-                result = self._find_first(child, filter_function)
-                if result is not None:
-                    return result
-        elif isinstance(obj, SingleChildTransformation):
-            return self._find_first(obj.child, filter_function)
-        return None
+        return find_first(obj, lambda x: x if filter_function(x) else None)
 
 
 class QProxy:
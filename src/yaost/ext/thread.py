@@ -118,6 +118,7 @@ def profile_helix(
     if top_height and not top_diameter:
         top_diameter = profile[0][0] + er2
 
+    # points are identified by (column, row) keys
     colrow_map = {}
     bottom_points = []
     top_points = []
@@ -158,20 +159,20 @@ def profile_helix(
                 else:
                     continue
 
-                point._col = angular_segment
-                point._row = z_idx * (len(profile) - 1) + subrow_idx
-                colrow_map[(point._col, point._row)] = point
+                col = angular_segment
+                row = z_idx * (len(profile) - 1) + subrow_idx
+                colrow_map[(col, row)] = point
 
                 if point.z == bottom_height:
                     if bottom_diameter and bottom_height:
                         bottom_point = Vector(bottom_diameter / 2, 0).rz(theta)
-                        bottom_point._col = point._col
-                        bottom_point._row = point._row - 1
-                        colrow_map[(bottom_point._col, bottom_point._row)] = bottom_point
+                        bottom_key = (col, row - 1)
+                        colrow_map[bottom_key] = bottom_point
                     else:
                         bottom_point = point
+                        bottom_key = (col, row)
 
-                    bottom_points.append(bottom_point)
+                    bottom_points.append((bottom_key, bottom_point))
 
                 # add top extra point
                 if z1 < length - top_height and z2 >= length - top_height:
@@ -179,58 +180,61 @@ def profile_helix(
                     r = r1 * (1.0 - gamma) + r2 * gamma
                     point = Vector(r, 0, length - top_height).rz(theta)
 
-                    point._col = angular_segment
-                    point._row = z_idx * (len(profile) - 1) + subrow_idx + 1
-                    colrow_map[(point._col, point._row)] = point
+                    row += 1
+                    colrow_map[(col, row)] = point
 
                 if point.z == length - top_height:
                     if top_diameter and top_height:
                         top_point = Vector(top_diameter / 2, 0, length).rz(theta)
-                        top_point._col = point._col
-                        top_point._row = point._row + 1
-                        colrow_map[(top_point._col, top_point._row)] = top_point
+                        top_key = (col, row + 1)
+                        colrow_map[top_key] = top_point
                     else:
                         top_point = point
-                    top_points.append(top_point)
+                        top_key = (col, row)
+                    top_points.append((top_key, top_point))
 
             z_idx += 1
 
+    # side faces are lists of point keys
     faces = []
 
     for (col, row), point in colrow_map.items():
         if col < fn - 1:
-            right_point = colrow_map.get((col + 1, row))
-            top_point = colrow_map.get((col, row + 1))
-            bottom_right_point = colrow_map.get((col + 1, row - 1))
+            right_key = (col + 1, row)
+            bottom_right_key = (col + 1, row - 1)
         else:
-            right_point = colrow_map.get((0, row + len(profile) - 1))
-            top_point = colrow_map.get((col, row + 1))
-            bottom_right_point = colrow_map.get((0, row + len(profile) - 2))
+            right_key = (0, row + len(profile) - 1)
+            bottom_right_key = (0, row + len(profile) - 2)
+        top_key = (col, row + 1)
 
-        if right_point is not None and top_point is not None:
-            faces.append([point, top_point, right_point])
+        if right_key not in colrow_map:
+            continue
 
-        if right_point is not None and bottom_right_point is not None:
-            faces.append([point, right_point, bottom_right_point])
+        if top_key in colrow_map:
+            faces.append(((col, row), top_key, right_key))
 
-    faces.append([p for p in sorted(bottom_points, key=lambda x: x._col)])
-    faces.append([p for p in sorted(top_points, key=lambda x: x._col, reverse=True)])
+        if bottom_right_key in colrow_map:
+            faces.append(((col, row), right_key, bottom_right_key))
 
     result_points = []
     result_faces = []
     seen_points = {}
+
+    def point_index(key, point):
+        idx = seen_points.get(key)
+        if idx is None:
+            idx = seen_points[key] = len(result_points)
+            result_points.append(point)
+        return idx
+
     for face in faces:
-        result_face = []
-        for p in face:
-            key = (p._col, p._row)
-            if key in seen_points:
-                idx = seen_points[key]
-            else:
-                idx = len(seen_points)
-                seen_points[key] = idx
-                result_points.append(p)
-            result_face.append(idx)
-        result_faces.append(result_face)
+        result_faces.append([point_index(key, colrow_map[key]) for key in face])
+
+    # caps keep their own points, they are (key, point) pairs
+    bottom_points.sort(key=lambda x: x[0][0])
+    top_points.sort(key=lambda x: x[0][0], reverse=True)
+    for face in (bottom_points, top_points):
+        result_faces.append([point_index(key, point) for key, point in face])
 
     result = polyhedron(
         points=result_points,
@@ -0,0 +1,233 @@
+"""Fingerprints of part functions made from their source.
+
+Fingerprint of a part covers code of the part function, plain values it
+is bound to, code of user functions it calls and sources of yaost and
+user modules it uses otherwise. Modules are followed through names they
+define, so a change in any module the part may use changes the
+fingerprint. Standard library and installed packages other than yaost
+are assumed not to change.
+
+Parts bound to values which can not be fingerprinted, like models built
+in advance, get no fingerprint and are always evaluated. Parts reading
+files or other outside state are not tracked either, `--force` builds
+them anew.
+"""
+import functools
+import hashlib
+import os
+import sys
+import sysconfig
+from types import CodeType, FunctionType, MethodType, ModuleType
+from typing import Dict, Optional, Set
+
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+class _NotFingerprintable(Exception):
+    pass
+
+
+class Fingerprinter:
+    """Computes fingerprints of parts, module hashes are reused between parts."""
+
+    def __init__(self):
+        self._module_hashes: Dict[str, str] = {}
+        self._module_closures: Dict[str, Set[str]] = {}
+
+    def fingerprint(self, part, *settings) -> Optional[str]:
+        h = hashlib.sha256()
+        try:
+            modules = self._update_with_callable(h, part)
+        except _NotFingerprintable:
+            return None
+        h.update(repr(settings).encode('utf-8'))
+
+        closure: Set[str] = set()
+        for name in modules:
+            closure |= self._module_closure(name)
+        # modules are identified by their sources only, so script run as
+        # __main__ and reloaded by watch gives the same fingerprint
+        for digest in sorted(self._module_hash(name) for name in closure):
+            h.update(digest.encode('utf-8'))
+        return h.hexdigest()
+
+    def _update_with_callable(self, h, part) -> Set[str]:
+        """Hashes callable and returns names of modules it refers to."""
+        hasher = _ValueHasher(h)
+        if isinstance(part, functools.partial):
+            hasher.update(part.args)
+            hasher.update(part.keywords)
+            part = part.func
+        if isinstance(part, MethodType):
+            hasher.update(getattr(part.__self__, '__dict__', None))
+            hasher.modules.add(type(part.__self__).__module__)
+            part = part.__func__
+        if not isinstance(part, FunctionType):
+            raise _NotFingerprintable
+        hasher.update(part)
+        return hasher.modules
+
+    def _module_closure(self, name: str) -> Set[str]:
+        """Names of tracked modules reachable from module globals."""
+        if name in self._module_closures:
+            return self._module_closures[name]
+
+        result: Set[str] = set()
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            module = sys.modules.get(current)
+            if current in result or not is_tracked_module(module):
+                continue
+            result.add(current)
+            stack.extend(module_dependencies(module))
+        self._module_closures[name] = result
+        return result
+
+    def _module_hash(self, name: str) -> str:
+        if name not in self._module_hashes:
+            path = sys.modules[name].__file__
+            try:
+                with open(path, 'rb') as fp:
+                    self._module_hashes[name] = hashlib.sha256(fp.read()).hexdigest()
+            except OSError:
+                # module without readable source, like a frozen one
+                self._module_hashes[name] = path
+        return self._module_hashes[name]
+
+
+@functools.lru_cache(maxsize=None)
+def _untracked_prefixes():
+    return tuple(
+        os.path.realpath(path)
+        for path in {sysconfig.get_path(key) for key in ('stdlib', 'platstdlib', 'purelib', 'platlib')}
+        if path
+    )
+
+
+def is_tracked_module(module: Optional[ModuleType]) -> bool:
+    """True for yaost and user modules, false for stdlib and installed packages."""
+    if module is None:
+        return False
+    name = module.__name__
+    if name == 'yaost' or name.startswith('yaost.'):
+        return True
+    path = getattr(module, '__file__', None)
+    if not path:
+        return False
+    return is_project_file(path)
+
+
+def is_project_file(path: str) -> bool:
+    """True for files outside of stdlib and installed packages."""
+    return not os.path.realpath(path).startswith(_untracked_prefixes())
+
+
+def is_user_module(module: Optional[ModuleType]) -> bool:
+    """Tracked module other than yaost itself."""
+    return is_tracked_module(module) and module.__name__ != 'yaost' and not module.__name__.startswith('yaost.')
+
+
+def module_dependencies(module: ModuleType) -> Set[str]:
+    """Names of modules module globals refer to, directly or by their values."""
+    result: Set[str] = set()
+    for value in list(vars(module).values()):
+        if isinstance(value, ModuleType):
+            result.add(value.__name__)
+            continue
+        value_module = getattr(value, '__module__', None)
+        if isinstance(value_module, str):
+            result.add(value_module)
+    return result
+
+
+def _update_with_code(h, code: CodeType):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            _update_with_code(h, const)
+        else:
+            h.update(repr(const).encode('utf-8'))
+
+
+class _ValueHasher:
+    def __init__(self, h):
+        self.h = h
+        self.modules: Set[str] = set()
+        self._seen_functions: Set[int] = set()
+
+    def update(self, value):
+        h = self.h
+        if isinstance(value, _PLAIN_TYPES):
+            h.update(repr(value).encode('utf-8'))
+        elif isinstance(value, (tuple, list, set, frozenset)):
+            h.update(type(value).__name__.encode('utf-8'))
+            items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+            for item in items:
+                self.update(item)
+            h.update(b'\0')
+        elif isinstance(value, dict):
+            h.update(b'dict')
+            for key in sorted(value, key=repr):
+                self.update(key)
+                self.update(value[key])
+            h.update(b'\0')
+        elif isinstance(value, FunctionType):
+            h.update(value.__qualname__.encode('utf-8'))
+            if not is_user_module(sys.modules.get(value.__module__)):
+                self.modules.add(value.__module__)
+                return
+            if id(value) in self._seen_functions:
+                return
+            self._seen_functions.add(id(value))
+            if _defined_in_class(value.__qualname__):
+                # methods read class attributes through self, which code
+                # does not name, class is covered by its module source
+                self.modules.add(value.__module__)
+            _update_with_code(h, value.__code__)
+            self.update(value.__defaults__)
+            self.update(value.__kwdefaults__)
+            for cell in value.__closure__ or ():
+                self.update(cell.cell_contents)
+            # user functions are followed through globals they use, so a
+            # change elsewhere in their module does not touch them
+            for name in sorted(_global_names(value.__code__)):
+                if name in value.__globals__:
+                    h.update(name.encode('utf-8'))
+                    self._update_with_global(value.__globals__[name], value.__module__)
+        elif isinstance(value, type):
+            h.update(value.__qualname__.encode('utf-8'))
+            self.modules.add(value.__module__)
+        elif isinstance(value, ModuleType):
+            h.update(value.__name__.encode('utf-8'))
+            self.modules.add(value.__name__)
+        else:
+            raise _NotFingerprintable
+
+    def _update_with_global(self, value, module_name: str):
+        # mutable globals may be changed by evaluation itself, they and
+        # objects which can not be hashed are covered by module source
+        if not isinstance(value, (list, dict, set)):
+            try:
+                self.update(value)
+                return
+            except _NotFingerprintable:
+                pass
+        self.h.update(b'\0module')
+        self.modules.add(module_name)
+
+
+def _defined_in_class(qualname: str) -> bool:
+    # in Outer.<locals>.inner every enclosing scope is a function, any
+    # other enclosing name is a class
+    parts = qualname.split('.')
+    return any(part != '<locals>' and following != '<locals>' for part, following in zip(parts, parts[1:]))
+
+
+def _global_names(code: CodeType) -> Set[str]:
+    result = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            result |= _global_names(const)
+    return result
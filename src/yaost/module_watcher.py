@@ -1,52 +1,228 @@
 #!/usr/bin/env python
 
-import pyinotify
+import importlib
 import os
+import sys
+import threading
+import time
+
+from .fingerprint import is_user_module, module_dependencies
+from .local_logging import get_logger
 from .packagefinder import PackageFinder
 
+try:
+    import pyinotify
+except Exception:  # noqa
+    # pyinotify fails on systems without inotify, files are polled there
+    pyinotify = None
+
+logger = get_logger(__name__)
 
-class ModuleWatcher(pyinotify.ProcessEvent):
+
+class ModuleWatcher:
     '''
-    Automatically reload any modules or packages as they change
+    Calls callback with files changed since previous call
+
+    Events coming within debounce seconds from each other are coalesced
+    into one call. Callback gets a function telling whether newer changes
+    came since the call started, so it can stop and leave them to the next
+    call. Files are polled where inotify is not available.
     '''
 
-    def __init__(self, script_path, callback=None):
-        'El constructor'
+    def __init__(self, script_path, callback=None, debounce=0.2, poll_interval=1.0, use_inotify=True):
+        self._callback = callback
+        self._debounce = debounce
+        self._poll_interval = poll_interval
+
+        self._script_path = script_path
+        self._finder = PackageFinder()
+        self._files = set()
+        self._directories = set()
+        self._files_lock = threading.Lock()
+
+        self._condition = threading.Condition()
+        self._pending = set()
+        self._last_event_time = 0.0
+        self._generation = 0
+        self._stopped = False
+        self._threads = []
 
-        self.wm = pyinotify.WatchManager()
+        self.wm = None
         self.notifier = None
+        self._update_files()
+        if use_inotify:
+            self._setup_inotify()
 
-        pf = PackageFinder()
-        self._callback = callback
-        self._files = set(pf.get_files_list(script_path))
-        self._directories = set()
-        for filename in self._files:
-            if not os.path.exists(filename):
-                continue
-            dirname = os.path.dirname(filename.rstrip('/'))
-            self._directories.add(dirname)
+    def _setup_inotify(self):
+        if pyinotify is None:
+            logger.warning('inotify is not available, polling files')
+            return
+        # editors saving through a temporary file rename it over the
+        # original one, others write it in place or create it anew
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE
+        try:
+            wm = pyinotify.WatchManager()
+            for dirname in self._directories:
+                wm.add_watch(dirname, mask, quiet=False)
+        except Exception:  # noqa
+            logger.warning('watching with inotify failed, polling files', exc_info=True)
+            return
+        self.wm = wm
+        self._mask = mask
+
+    def _update_files(self):
+        # imports may change with any change, files found anew are
+        # watched from now on
+        with self._files_lock:
+            files = {os.path.abspath(filename) for filename in self._finder.get_files_list(self._script_path)}
+            directories = {os.path.dirname(filename) for filename in files if os.path.exists(filename)}
+            if self.wm is not None:
+                for dirname in directories - self._directories:
+                    try:
+                        self.wm.add_watch(dirname, self._mask, quiet=False)
+                    except Exception:  # noqa
+                        logger.warning('watching %s failed', dirname, exc_info=True)
+            self._files = files
+            self._directories |= directories
 
-        for dirname in self._directories:
-            self.wm.add_watch(dirname, pyinotify.ALL_EVENTS)
+    @property
+    def generation(self) -> int:
+        '''Number of changes seen so far'''
+        return self._generation
 
     def start_watching(self):
-        'Start the pyinotify watch thread'
+        'Start the watch threads'
 
-        if self.notifier is None:
-            self.notifier = pyinotify.ThreadedNotifier(self.wm, self)
-        self.notifier.start()
+        self._stopped = False
+        if self.wm is not None:
+            if self.notifier is None:
+                self.notifier = pyinotify.ThreadedNotifier(self.wm, self._process_event)
+            self.notifier.start()
+        else:
+            self._start_thread(self._poll)
+        self._start_thread(self._dispatch)
 
     def stop_watching(self):
-        'Stop the pyinotify watch thread'
+        'Stop the watch threads'
 
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
         if self.notifier is not None:
             self.notifier.stop()
+            self.notifier = None
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
 
-    def process_IN_MODIFY(self, event):
-        'A file of interest has changed'
+    def _start_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
 
-        # Is it a file I know about?
-        if event.pathname not in self._files:
+    def _process_event(self, event):
+        path = event.pathname
+        if path not in self._files and path.endswith('.py'):
+            # module imported before it was created
+            self._update_files()
+        if path in self._files:
+            self._changed(path)
+
+    def _changed(self, path):
+        with self._condition:
+            self._pending.add(path)
+            self._last_event_time = time.monotonic()
+            self._generation += 1
+            self._condition.notify_all()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                delay = self._last_event_time + self._debounce - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                paths, self._pending = self._pending, set()
+                generation = self._generation
+
+            try:
+                self._update_files()
+            except Exception:  # noqa
+                logger.exception('updating watched files failed')
+            if self._callback is None:
+                continue
+            try:
+                self._callback(paths, lambda: self._generation != generation)
+            except Exception:  # noqa
+                logger.exception('watch callback failed')
+
+    def _poll(self):
+        stats = {filename: _stat(filename) for filename in self._files}
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                self._condition.wait(self._poll_interval)
+            self._update_files()
+            for filename in self._files:
+                new_stat = _stat(filename)
+                if new_stat != stats.get(filename):
+                    stats[filename] = new_stat
+                    self._changed(filename)
+
+
+def _stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def reload_modules(paths, skip=()):
+    """Reloads user modules loaded from paths and user modules using them.
+
+    Modules are reloaded after modules they use, so names they import are
+    taken from fresh modules. Returns names of reloaded modules.
+    """
+    paths = {os.path.realpath(path) for path in paths}
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        if name in skip or not is_user_module(module):
+            continue
+        modules[name] = module
+
+    dependencies = {
+        name: module_dependencies(module) & modules.keys() - {name}
+        for name, module in modules.items()
+    }
+    stale = {name for name, module in modules.items() if os.path.realpath(module.__file__) in paths}
+    changed = True
+    while changed:
+        changed = False
+        for name, used in dependencies.items():
+            if name not in stale and used & stale:
+                stale.add(name)
+                changed = True
+
+    reloaded = []
+    visited = set()
+
+    def visit(name):
+        if name in visited:
             return
-        if self._callback is not None:
-            getattr(self, '_callback')(event.pathname)
+        visited.add(name)
+        for dependency in sorted(dependencies[name] & stale):
+            visit(dependency)
+        importlib.reload(modules[name])
+        reloaded.append(name)
+
+    for name in sorted(stale):
+        visit(name)
+    return reloaded
@@ -0,0 +1,203 @@
+"""Tree rewriting passes applied before serialization.
+
+Passes never modify nodes in place, changed nodes are shallow copies, so
+the model stays usable after it is serialized. Passes are meant for
+generated scad only, labels and other attributes of removed nodes are
+not preserved.
+"""
+from typing import Callable, Dict, Set
+
+from yaost.affine import multiply
+from yaost.base import BaseObject
+from yaost.body import Empty
+from yaost.transformation import (
+    Difference,
+    Hull,
+    Intersection,
+    Join,
+    Minkowski,
+    Mirror,
+    MultMatrix,
+    Rotate,
+    Scale,
+    SingleChildTransformation,
+    Union,
+    _join_statements,
+    _statements,
+)
+from yaost.traversal import iter_postorder
+
+DEFAULT_EPSILON = 1e-3
+
+
+def rewrite(root: BaseObject, callback: Callable[[BaseObject, BaseObject], BaseObject]) -> BaseObject:
+    """Rebuilds tree bottom-up.
+
+    Callback receives node with already rewritten children together with
+    the original node and returns its replacement. Every object is
+    rewritten once, so subtrees shared between several parents stay
+    shared.
+    """
+    rewritten: Dict[int, BaseObject] = {}
+    # NOTE original nodes are kept alive by root, so ids are stable
+    for node in iter_postorder(root, unique=True):
+        children = node._tree_children()
+        new_children = [rewritten[id(child)] for child in children]
+        result = node
+        if any(new is not old for new, old in zip(new_children, children)):
+            result = node._with_children(new_children)
+        rewritten[id(node)] = callback(result, node)
+    return rewritten[id(root)]
+
+
+def _compose_affine(node: BaseObject, original: BaseObject) -> BaseObject:
+    if isinstance(node, (Rotate, Mirror, Scale)) and node._center:
+        # centered transformation takes three statements, one matrix
+        # may be enough even when the child is emitted twice
+        matrix = node._transform_matrix()
+        if matrix is None:
+            return node
+        if node._clone:
+            composed = MultMatrix(matrix, node.child, clone=True)
+            size = _statements_size(composed)
+            if node.child._affine_matrix() is not None:
+                # statements of affine child are merged into the copy
+                size -= _statements_size(node.child)
+            return composed if size < _statements_size(node) else node
+        node = MultMatrix(matrix, node.child, replaced=_statements(node))
+
+    matrix = node._affine_matrix()
+    if matrix is None:
+        return node
+
+    child = node.child
+    child_matrix = child._affine_matrix()
+    if child_matrix is not None:
+        replaced = _join_statements(_statements(node), _statements(child))
+        return MultMatrix(multiply(matrix, child_matrix), child.child, replaced=replaced)
+    return node
+
+
+def _statements_size(node: BaseObject) -> int:
+    return sum(len(part) for part in node._scad_parts() if isinstance(part, str))
+
+
+def compose_affine(root: BaseObject) -> BaseObject:
+    """Replaces chains of translate, rotate, mirror and scale with one multmatrix.
+
+    Cloning transformations break chains, they have to emit their child
+    twice anyway. Composed chains remember statements they replace and
+    emit them instead of the matrix when those are shorter.
+    """
+    return rewrite(root, _compose_affine)
+
+
+def _join_region(root: BaseObject) -> Set[int]:
+    """Ids of nodes inside added children of joins.
+
+    Join subtracts holes of differences found in its added children
+    through unions and transformations from all of its solids. Such
+    differences can not be simplified on their own and nothing else
+    may turn into a difference there.
+    """
+    result: Set[int] = set()
+    for node in iter_postorder(root, unique=True):
+        if not isinstance(node, Join):
+            continue
+        stack = list(node.children[1:])
+        while stack:
+            child = stack.pop()
+            result.add(id(child))
+            if isinstance(child, (Union, SingleChildTransformation)):
+                stack.extend(child._tree_children())
+    return result
+
+
+def _overlapping_holes(solid: BaseObject, holes, eps: float) -> list:
+    bbox = solid.bbox
+    return [hole for hole in holes if bbox.overlaps(hole.bbox, eps)]
+
+
+def _simplify_csg(node: BaseObject, eps: float) -> BaseObject:
+    if isinstance(node, SingleChildTransformation):
+        if isinstance(node.child, Empty):
+            return node.child
+        return node
+
+    if isinstance(node, (Union, Hull, Minkowski, Intersection)):
+        children = [child for child in node.children if not isinstance(child, Empty)]
+        if len(children) < len(node.children) and isinstance(node, (Minkowski, Intersection)):
+            return Empty()
+        if not children:
+            return Empty()
+        if isinstance(node, Intersection) and not _bboxes_intersect(node.collapse(Intersection), eps):
+            return Empty()
+        if len(children) == 1 and not isinstance(node, Hull):
+            return children[0]
+        if len(children) < len(node.children):
+            return node._with_children(children)
+        return node
+
+    if isinstance(node, Difference):
+        solid = node.children[0]
+        if isinstance(solid, Empty):
+            return solid
+        # holes accumulated with += are emitted flattened, they are
+        # pruned one by one as well
+        candidates = [hole for child in node.children[1:] for hole in child.collapse(Union)]
+        holes = _overlapping_holes(solid, candidates, eps)
+        if not holes:
+            return solid
+        if len(holes) < len(candidates):
+            return node._with_children([solid] + holes)
+        return node
+
+    if isinstance(node, Join):
+        chunks = list(node.collapse(Join))
+        if not chunks:
+            return Empty()
+        solid = chunks[0]
+        holes = _overlapping_holes(solid, chunks[1:], eps)
+        if not holes:
+            return solid
+        return Difference([solid] + holes)
+
+    return node
+
+
+def _bboxes_intersect(nodes, eps: float) -> bool:
+    # pairwise overlapping boxes always have a common point
+    bboxes = [node.bbox for node in nodes]
+    if any(bbox.is_empty for bbox in bboxes):
+        return False
+    for axis in ('x', 'y', 'z'):
+        lo = max(getattr(bbox.vmin, axis) for bbox in bboxes)
+        hi = min(getattr(bbox.vmax, axis) for bbox in bboxes)
+        if lo > hi + eps:
+            return False
+    return True
+
+
+def simplify_csg(root: BaseObject, eps: float = DEFAULT_EPSILON) -> BaseObject:
+    """Removes boolean operations which do not change the result.
+
+    Subtrahends whose boxes do not touch the solid are dropped,
+    intersections of disjoint operands become empty and booleans left
+    with a single operand are replaced with it. Boxes closer than eps
+    are considered touching, unknown boxes touch everything, so the
+    pass never changes the geometry. Hull is never flattened, hull of
+    a single child is not the child itself.
+    """
+    region = _join_region(root)
+
+    def callback(node, original):
+        if id(original) not in region:
+            return _simplify_csg(node, eps)
+        if isinstance(node, (Difference, Join)):
+            return node
+        result = _simplify_csg(node, eps)
+        if isinstance(node, (Intersection, Minkowski)) and isinstance(result, (Difference, Join)):
+            return node
+        return result
+
+    return rewrite(root, callback)
@@ -1,57 +1,114 @@
+import ast
 import os
-from types import ModuleType
-from importlib import import_module
+import sys
+from collections import deque
+from typing import Dict, List, Optional, Tuple
 
+from .fingerprint import is_project_file
+from .local_logging import get_logger
 
-# TODO make this function work with any python
-# currently working wity python >= 3.5
-def import_from_file(path):
-    import importlib.util
-    spec = importlib.util.spec_from_file_location('__not_main__', path)
-    foo = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(foo)
-    return foo
+logger = get_logger(__name__)
+
+_STATEMENT_FIELDS = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
 
 
 class PackageFinder(object):
+    '''
+    Finds project files a script imports without running it
+
+    Imports are read from syntax trees of files and resolved against
+    script directory and sys.path the way python does it. Only project
+    files are followed, stdlib and installed packages are skipped. Trees
+    are parsed again only for files changed since previous call, so
+    finder kept between calls updates the graph cheaply.
+    '''
 
-    def _find_required_modules(self, module, processed_modules=None):
-        if module.__name__ in ('__builtin__', '__future__'):
-            return
-
-        if processed_modules is None:
-            processed_modules = set()
-
-        if module in processed_modules:
-            return processed_modules
-
-        processed_modules.add(module)
-        names = dir(module)
-        for name in names:
-            if name[0] == '_':
-                continue
-            obj = getattr(module, name)
-            if isinstance(obj, ModuleType):
-                self._find_required_modules(obj, processed_modules)
-            elif hasattr(obj, '__module__') and obj.__module__ is not None:
-                # in case of 'import somename from somemodule'
-                # somename will be in globals and somemodule not
-                # to get somemodule we need to get somename.__module__
-                try:
-                    obj = import_module(obj.__module__)
-                    self._find_required_modules(obj, processed_modules)
-                except ImportError:
-                    pass
-
-        return processed_modules
+    def __init__(self):
+        self._imports: Dict[str, Tuple[tuple, List[Tuple[int, str, Tuple[str, ...]]]]] = {}
 
     def get_files_list(self, script_path):
         script_path = os.path.abspath(script_path)
-        module = import_from_file(script_path)
-        modules = self._find_required_modules(module)
-        files = set()
-        for module in modules:
-            if not hasattr(module, '__file__') or module.__file__ == '':
-                continue
-            files.add(os.path.abspath(module.__file__))
+        roots = [os.path.dirname(script_path)]
+        roots.extend(os.path.abspath(path or os.curdir) for path in sys.path)
+        resolved: Dict[Tuple[Optional[str], str], Optional[str]] = {}
+
+        files = {script_path}
+        queue = deque([script_path])
+        while queue:
+            filename = queue.popleft()
+            for key in self._get_imported_modules(filename):
+                if key not in resolved:
+                    directory, name = key
+                    resolved[key] = _resolve(name, roots if directory is None else [directory])
+                path = resolved[key]
+                if path is None or path in files or not is_project_file(path):
+                    continue
+                files.add(path)
+                queue.append(path)
         return list(files)
+
+    def _get_imported_modules(self, filename):
+        '''Modules and packages file may import, as (directory, name) pairs
+
+        Directory is where relative imports are looked up, None for
+        absolute ones.
+        '''
+        result = []
+        for level, module, names in self._get_imports(filename):
+            directory = None
+            if level:
+                directory = os.path.dirname(filename)
+                for _ in range(level - 1):
+                    directory = os.path.dirname(directory)
+            parts = module.split('.') if module else []
+            for i in range(1, len(parts) + 1):
+                result.append((directory, '.'.join(parts[:i])))
+            # names imported from package may be its submodules
+            for name in names:
+                result.append((directory, '.'.join((*parts, name))))
+        return result
+
+    def _get_imports(self, filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return []
+        stat = (st.st_size, st.st_mtime_ns)
+        cached = self._imports.get(filename)
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+
+        imports = []
+        try:
+            with open(filename, 'rb') as fp:
+                tree = ast.parse(fp.read(), filename)
+        except (OSError, SyntaxError, ValueError):
+            # file being edited is retried when it changes again
+            logger.debug('failed to parse %s', filename, exc_info=True)
+        else:
+            # imports are statements, expressions are not walked into
+            stack = list(tree.body)
+            while stack:
+                node = stack.pop()
+                if isinstance(node, ast.Import):
+                    imports.extend((0, alias.name, ()) for alias in node.names)
+                elif isinstance(node, ast.ImportFrom):
+                    names = tuple(alias.name for alias in node.names if alias.name != '*')
+                    imports.append((node.level, node.module or '', names))
+                else:
+                    for field in _STATEMENT_FIELDS:
+                        stack.extend(getattr(node, field, ()))
+        self._imports[filename] = (stat, imports)
+        return imports
+
+
+def _resolve(name, roots) -> Optional[str]:
+    parts = name.split('.')
+    for root in roots:
+        path = os.path.join(root, *parts)
+        if os.path.isfile(path + '.py'):
+            return path + '.py'
+        init_path = os.path.join(path, '__init__.py')
+        if os.path.isfile(init_path):
+            return init_path
+    return None
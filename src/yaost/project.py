@@ -3,22 +3,37 @@ import datetime
 import fnmatch
 import functools
 import hashlib
+import importlib.util
 import inspect
-import json
+import io
 import logging
+import mmap
+import multiprocessing
 import os
+import re
 import subprocess
 import sys
 import time
+import traceback
 import uuid
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, List, NamedTuple, Optional
 
 from .base import BaseObject
+from .cache import ArtifactStore, BuildCache
+from .fingerprint import Fingerprinter
 from .local_logging import get_logger
-from .module_watcher import ModuleWatcher
+from .module_watcher import ModuleWatcher, reload_modules
 
 logger = get_logger(__name__)
 
+_YAOST_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+# watch executes script again under this name, so it does not run itself
+_WATCHED_MODULE = '__yaost_watched__'
+
+_READ_SIZE = 1 << 20
+_MMAP_THRESHOLD = 16 << 20
+
 
 def alphabet_encode(number: int, alphabet='0123456789ABCDEFGHJKLMNPRSTUVWXYZ', padding: int = 0) -> str:
     """Converts an integer to a base|alphabet_length| string."""
@@ -34,6 +49,36 @@ def alphabet_encode(number: int, alphabet='0123456789ABCDEFGHJKLMNPRSTUVWXYZ', p
     return ''.join(reversed(chunks))
 
 
+def part_selected(name: str, include: str) -> bool:
+    """Matches part name against glob pattern or regex prefixed with `re:`."""
+    if not include:
+        return True
+    if include.startswith('re:'):
+        return re.search(include[3:], name) is not None
+    return fnmatch.fnmatch(name, include)
+
+
+class ScadPart(NamedTuple):
+    name: str
+    # model is not sent back from worker processes
+    model: Optional[BaseObject]
+    is_2d: bool
+    scad_file_path: str
+    scad_hash: str
+
+
+# project of the parent, forked worker processes evaluate its parts
+_worker_project: Optional['Project'] = None
+
+
+def _render_part_in_worker(name: str, options: dict):
+    try:
+        model = _worker_project._evaluate_part(name)
+        return _worker_project._render_part(model, **options), model.is_2d, None
+    except Exception:  # noqa
+        return None, False, traceback.format_exc()
+
+
 class Project:
     _single_run_guard = False
 
@@ -49,6 +94,7 @@ class Project:
         self._fn = fn
         self.name = name
         self.parts = {}
+        self._openscad_version = None
 
     def add_class(self, class_):
         instance = None
@@ -117,53 +163,60 @@ class Project:
     def build_stl(self, args):
         self.build(args, stl_only=True)
 
-    def iterate_parts(self):
-        for name in sorted(self.parts):
-            method_or_object = self.parts[name]
-            try:
-                cls = self._get_class_that_defines_method(method_or_object)
-
-                if isinstance(method_or_object, BaseObject):
-                    yield name, method_or_object
-                elif cls is not None:
-                    obj = cls()
-                    model = method_or_object(obj)
-                else:
-                    model = method_or_object()
+    def iterate_parts(self, include: str = ''):
+        return self._evaluate_parts(name for name in sorted(self.parts) if part_selected(name, include))
 
-                yield name, model
+    def _evaluate_parts(self, names):
+        for name in names:
+            try:
+                model = self._evaluate_part(name)
             except:  # noqa
                 logger.exception(f'failed to run model {name}')
                 continue
+            yield name, model
 
-    def build(self, args, stl_only=False):
-        self.build_scad(args)
-        cache = self._read_cache(args.cache_file)
-        now_ts = datetime.datetime.now().strftime('%Y%d%m%H%M%S')
-        if 'scad_cache' not in cache:
-            cache['scad_cache'] = {}
-        if 'projects' not in cache:
-            cache['projects'] = {}
-
-        if self.name not in cache['projects']:
-            cache['projects'][self.name] = {}
+    def _evaluate_part(self, name: str) -> BaseObject:
+        method_or_object = self.parts[name]
+        cls = self._get_class_that_defines_method(method_or_object)
 
-        if 'version' not in cache['projects'][self.name]:
-            cache['projects'][self.name]['version'] = 0
+        if isinstance(method_or_object, BaseObject):
+            return method_or_object
+        if cls is not None:
+            obj = cls()
+            return method_or_object(obj)
+        return method_or_object()
 
-        version = cache['projects'][self.name]['version']
+    def build(self, args, stl_only=False):
+        now_ts = datetime.datetime.now().strftime('%Y%d%m%H%M%S')
 
         if not os.path.exists(args.build_directory):
             os.makedirs(args.build_directory)
 
-        for name, model in self.iterate_parts():
-            if args.include and not fnmatch.fnmatch(name, args.include):
-                continue
+        with BuildCache(args.cache_file) as cache:
+            parts = self.build_scad(args, optimize=True, cache=cache)
+            failed = self._build_parts(args, cache, parts, now_ts, stl_only)
 
-            scad_file_path = os.path.join(args.scad_directory, self.name, name + '.scad')
+        if failed:
+            logger.error('failed to build %s', ', '.join(sorted(failed)))
+            sys.exit(1)
 
+    def _build_parts(
+        self,
+        args,
+        cache: BuildCache,
+        parts: List['ScadPart'],
+        now_ts: str,
+        stl_only: bool,
+    ) -> List[str]:
+        version = cache.get_version(self.name)
+        store = None
+        if getattr(args, 'artifact_store', ''):
+            store = ArtifactStore(args.artifact_store)
+
+        jobs = []
+        for name, _, is_2d, scad_file_path, scad_hash in parts:
             extension = '.stl'
-            if model.is_2d:
+            if is_2d:
                 extension = '.svg'
                 if stl_only:
                     continue
@@ -174,23 +227,36 @@ class Project:
 
             result_file_path = os.path.join(target_directory, name + extension)
 
-            cache_record = cache['scad_cache'].get(scad_file_path, {})
-            if not isinstance(cache_record, dict):
-                cache_record = {}
-            scad_hash = self._get_files_hash(scad_file_path)
+            cache_record = cache.get_record(scad_file_path) or {}
             if os.path.exists(result_file_path) and not args.force:
-                build_hash = self._get_files_hash(result_file_path)
+                build_hash = self._get_cached_file_hash(cache, result_file_path)
             else:
                 build_hash = ''
 
             if cache_record.get('build_hash', '') == build_hash and cache_record.get('scad_hash', '') == scad_hash:
                 continue
 
+            artifact_key = None
+            if store is not None:
+                # stamps passed with -D do not take part in the key, stored
+                # results keep stamps of the build which rendered them
+                artifact_key = store.key(scad_hash, extension, self._get_openscad_version())
+                if not args.force and store.fetch(artifact_key, extension, result_file_path):
+                    logger.info('%s%s taken from artifact store', name, extension)
+                    build_hash = self._get_cached_file_hash(cache, result_file_path)
+                    cache.set_record(scad_file_path, scad_hash, build_hash, version + 1)
+                    cache.set_version(self.name, version + 1)
+                    continue
+
+            # result is rendered aside and moved into place, so files
+            # linked from artifact store are never written in place
+            base, _ = os.path.splitext(result_file_path)
+            temporary_path = f'{base}.{os.getpid()}.tmp{extension}'
             command_args = [
                 'openscad',
                 scad_file_path,
                 '-o',
-                result_file_path,
+                temporary_path,
                 '-D',
                 f'timestamp="{now_ts}"',
                 '-D',
@@ -202,92 +268,277 @@ class Project:
                 '-D',
                 f'cmark="{alphabet_encode(version, padding=2)}"',
             ]
-            subprocess.call(command_args, shell=False)
-
-            build_hash = self._get_files_hash(result_file_path)
-            cache['scad_cache'][scad_file_path] = {
-                'scad_hash': scad_hash,
-                'build_hash': build_hash,
-                'version': version + 1,
-            }
-            cache['projects'][self.name]['version'] = version + 1
-            self._write_cache(args.cache_file, cache)
-
-    def build_scad(self, args):
-        for name, model in self.iterate_parts():
-            file_path = os.path.join(args.scad_directory, self.name, name + '.scad')
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, 'w') as fp:
-                for key in ('fa', 'fs', 'fn'):
-                    value = getattr(self, f'_{key}', None)
-                    if value is not None:
-                        fp.write(f'${key}={value:.6f};\n')
-                fp.write('timestamp="0000-00-00T00:00:00";\n')
-                fp.write('hash="00000000";\n')
-                fp.write('version="000000";\n')
-                fp.write('mark="000.";\n')
-                fp.write('cmark="00";\n')
-                scad_code = model.to_scad()
-                fp.write(scad_code)
-                fp.write('\n')
-        logger.info('scad build done')
+            jobs.append((name, scad_file_path, result_file_path, temporary_path, scad_hash, artifact_key, command_args))
+
+        failed = []
+        # openscad runs in subprocesses, threads only wait for them, cache
+        # is updated from this thread as jobs complete
+        with ThreadPoolExecutor(max_workers=max(1, getattr(args, 'jobs', 1) or 1)) as executor:
+            futures = {executor.submit(self._run_openscad, job[-1]): job for job in jobs}
+            for future in as_completed(futures):
+                name, scad_file_path, result_file_path, temporary_path, scad_hash, artifact_key, _ = futures[future]
+                returncode, output = future.result()
+                if output:
+                    logger.info('openscad output for %s:\n%s', name, output.rstrip())
+                if returncode != 0 or not os.path.exists(temporary_path):
+                    logger.error('building %s failed with exit code %d', name, returncode)
+                    if os.path.exists(temporary_path):
+                        os.unlink(temporary_path)
+                    failed.append(name)
+                    continue
 
-    def watch(self, args):
-        import __main__
+                os.replace(temporary_path, result_file_path)
+                if artifact_key is not None:
+                    store.store(artifact_key, os.path.splitext(result_file_path)[1], result_file_path)
+                build_hash = self._get_cached_file_hash(cache, result_file_path)
+                cache.set_record(scad_file_path, scad_hash, build_hash, version + 1)
+                cache.set_version(self.name, version + 1)
+        return failed
+
+    def _get_openscad_version(self) -> str:
+        if self._openscad_version is None:
+            returncode, output = self._run_openscad(['openscad', '--version'])
+            self._openscad_version = output.strip() if returncode == 0 else 'unknown'
+        return self._openscad_version
+
+    def _run_openscad(self, command_args):
+        try:
+            process = subprocess.run(
+                command_args,
+                shell=False,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                encoding='utf-8',
+                errors='replace',
+            )
+        except OSError as e:
+            return 127, str(e)
+        return process.returncode, process.stdout
 
-        def build_scad_generator(args, script_path):
-            def real_scad_generator(*args_array, **kwargs_hash):
-                command_args = [
-                    __main__.__file__,
-                    '--scad-directory',
-                    args.scad_directory,
-                ]
-                if args.debug:
-                    command_args.append('--debug')
-                command_args.append('build-scad')
+    def build_scad(
+        self,
+        args,
+        optimize=False,
+        cache: Optional[BuildCache] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> List['ScadPart']:
+        """Evaluates every changed part once and writes its scad file.
+
+        Build stops after a part once `cancelled` returns true, parts done
+        by then are cached and are not evaluated again by the next build.
+        """
+        if cache is None:
+            with BuildCache(args.cache_file) as cache:
+                return self.build_scad(args, optimize=optimize, cache=cache, cancelled=cancelled)
+
+        # scad files built for openscad itself are optimized by default,
+        # the ones for humans keep transformations as they were written
+        modules = optimize
+        if getattr(args, 'scad_modules', None) is not None:
+            modules = args.scad_modules
+        multmatrix = optimize
+        if getattr(args, 'scad_multmatrix', None) is not None:
+            multmatrix = args.scad_multmatrix
+        simplify = optimize
+        if getattr(args, 'scad_simplify', None) is not None:
+            simplify = args.scad_simplify
+        options = dict(modules=modules, multmatrix=multmatrix, simplify=simplify)
+        include = getattr(args, 'include', '')
+
+        # parts with the same fingerprint as scad file on disk was built
+        # with are not evaluated at all
+        fingerprinter = Fingerprinter()
+        result = []
+        names = []
+        fingerprints = {}
+        for name in sorted(self.parts):
+            if not part_selected(name, include):
+                continue
+            file_path = self._get_scad_file_path(args, name)
+            fingerprint = fingerprinter.fingerprint(
+                self.parts[name], self._fa, self._fs, self._fn, modules, multmatrix, simplify
+            )
+            fingerprints[name] = fingerprint
+            known = cache.get_fingerprint(file_path)
+            if (
+                fingerprint is not None
+                and not args.force
+                and known is not None
+                and known[0] == fingerprint
+                and os.path.exists(file_path)
+                and self._get_cached_file_hash(cache, file_path) == known[1]
+            ):
+                logger.debug('%s is not changed', name)
+                result.append(ScadPart(name, None, known[2], file_path, known[1]))
+                continue
+            names.append(name)
+
+        jobs = getattr(args, 'jobs', 1) or 1
+        if jobs > 1 and len(names) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            rendered = self._render_parts_in_processes(names, options, jobs)
+        else:
+            rendered = (
+                (name, model, self._render_part(model, **options), model.is_2d)
+                for name, model in self._evaluate_parts(names)
+            )
+
+        for name, model, data, is_2d in rendered:
+            file_path = self._get_scad_file_path(args, name)
+            # unchanged files keep their mtime, so viewers do not reload them
+            if self._write_if_changed(file_path, data):
+                logger.debug('%s updated', file_path)
+            scad_hash = self._get_data_hash(data)
+            st = os.stat(file_path)
+            cache.set_file_hash(file_path, (st.st_size, st.st_mtime_ns, st.st_ino), scad_hash)
+            if fingerprints[name] is not None:
+                cache.set_fingerprint(file_path, fingerprints[name], scad_hash, is_2d)
+            result.append(ScadPart(name, model, is_2d, file_path, scad_hash))
+            if cancelled is not None and cancelled():
+                logger.info('scad build superseded by newer changes')
+                break
+        else:
+            logger.info('scad build done')
+        result.sort(key=lambda part: part.name)
+        return result
+
+    def _get_scad_file_path(self, args, name: str) -> str:
+        return os.path.join(args.scad_directory, self.name, name + '.scad')
+
+    def _render_part(self, model: BaseObject, **options) -> bytes:
+        fp = io.StringIO()
+        for key in ('fa', 'fs', 'fn'):
+            value = getattr(self, f'_{key}', None)
+            if value is not None:
+                fp.write(f'${key}={value:.6f};\n')
+        fp.write('timestamp="0000-00-00T00:00:00";\n')
+        fp.write('hash="00000000";\n')
+        fp.write('version="000000";\n')
+        fp.write('mark="000.";\n')
+        fp.write('cmark="00";\n')
+        model.write_scad(fp, **options)
+        fp.write('\n')
+        return fp.getvalue().encode('utf-8')
+
+    def _render_parts_in_processes(self, names: List[str], options: dict, jobs: int):
+        global _worker_project
+
+        # part functions are not picklable, forked workers find them in
+        # the project set before the pool starts
+        _worker_project = self
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+                futures = [executor.submit(_render_part_in_worker, name, options) for name in names]
                 try:
-                    subprocess.call(command_args, shell=False)
-                except OSError:
-                    time.sleep(0.1)
-                    subprocess.call(command_args, shell=False)
+                    for name, future in zip(names, futures):
+                        try:
+                            data, is_2d, error = future.result()
+                        except Exception:  # noqa
+                            # worker died, the rest of the pool is broken too
+                            data, error = None, traceback.format_exc()
+                        if error is not None:
+                            logger.error('failed to run model %s\n%s', name, error.rstrip())
+                            continue
+                        yield name, None, data, is_2d
+                finally:
+                    # parts not started yet are dropped when build is cancelled
+                    executor.shutdown(cancel_futures=True)
+        finally:
+            _worker_project = None
+
+    def watch(self, args):
+        import __main__
 
-            return real_scad_generator
+        script_path = os.path.abspath(__main__.__file__)
 
-        callback = build_scad_generator(args, __main__.__file__)
-        mw = ModuleWatcher(__main__.__file__, callback)
+        def rebuild(changed_paths=(), cancelled=None):
+            try:
+                if changed_paths:
+                    self._reload(script_path, changed_paths)
+                self.build_scad(args, cancelled=cancelled)
+            except Exception:  # noqa
+                logger.exception('rebuild failed')
+
+        mw = ModuleWatcher(
+            script_path,
+            rebuild,
+            debounce=getattr(args, 'debounce', 0.2),
+            use_inotify=not getattr(args, 'poll', False),
+        )
         try:
-            callback()
+            rebuild()
             mw.start_watching()
             while True:
                 time.sleep(0.1)
         finally:
             mw.stop_watching()
 
+    def _reload(self, script_path: str, changed_paths):
+        """Takes parts from script executed anew with changed modules reloaded."""
+        for path in changed_paths:
+            if os.path.realpath(path).startswith(_YAOST_DIRECTORY + os.sep):
+                # yaost itself can not be reloaded under objects built with it
+                logger.info('%s changed, restarting', path)
+                os.execv(sys.executable, [sys.executable] + sys.argv)
+
+        reloaded = reload_modules(changed_paths, skip=('__main__', _WATCHED_MODULE))
+        if reloaded:
+            logger.debug('reloaded %s', ', '.join(reloaded))
+
+        spec = importlib.util.spec_from_file_location(_WATCHED_MODULE, script_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[_WATCHED_MODULE] = module
+        spec.loader.exec_module(module)
+        for value in vars(module).values():
+            if isinstance(value, Project) and value.name == self.name:
+                break
+        else:
+            raise ValueError(f'project {self.name} not found in {script_path}')
+        self.parts = value.parts
+        self._fa, self._fs, self._fn = value._fa, value._fs, value._fn
+
     def _get_caller_module_name(self, depth=1):
         frm = inspect.stack()[depth + 1]
         mod = inspect.getmodule(frm[0])
         return mod.__name__
 
-    def _read_cache(self, cache_file):
-        result = {}
-        if not os.path.exists(cache_file):
-            return {}
+    def _write_if_changed(self, file_path: str, data: bytes) -> bool:
         try:
-            with open(cache_file) as fp:
-                result = json.load(fp)
-        except:  # noqa
-            logger.error('reading cache failed', exc_info=True)
-            result = {}
-        return result
+            with open(file_path, 'rb') as fp:
+                if fp.read() == data:
+                    return False
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-    def _write_cache(self, cache_file, cache):
+        temporary_path = f'{file_path}.{os.getpid()}.tmp'
         try:
-            with open(cache_file, 'w', encoding='utf-8') as fp:
-                json.dump(cache, fp, ensure_ascii=False)
-        except:  # noqa
-            logger.error('writing cache failed', exc_info=True)
-            return
-        return
+            with open(temporary_path, 'wb') as fp:
+                fp.write(data)
+            os.replace(temporary_path, file_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+        return True
+
+    def _get_data_hash(self, data: bytes) -> str:
+        """Same as `_get_files_hash` of a file with this data."""
+        h = hashlib.sha256()
+        h.update(b'\0\0\0\1\0\0')
+        h.update(data)
+        return h.hexdigest()
+
+    def _get_cached_file_hash(self, cache: BuildCache, filename: str) -> str:
+        # unchanged files are not read again, files written by build are
+        # replaced with new ones and get new inodes
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return self._get_files_hash(filename)
+        stat = (st.st_size, st.st_mtime_ns, st.st_ino)
+        result = cache.get_file_hash(filename, stat)
+        if result is None:
+            result = self._get_files_hash(filename)
+            cache.set_file_hash(filename, stat, result)
+        return result
 
     def _get_files_hash(self, *filenames):
         try:
@@ -295,7 +546,11 @@ class Project:
             for filename in filenames:
                 h.update(b'\0\0\0\1\0\0')
                 with open(filename, 'rb') as f:
-                    for chunk in iter(lambda: f.read(4096), b''):  # noqa
+                    if os.fstat(f.fileno()).st_size >= _MMAP_THRESHOLD:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                            h.update(data)
+                        continue
+                    for chunk in iter(lambda: f.read(_READ_SIZE), b''):  # noqa
                         h.update(chunk)
             return h.hexdigest()
         except Exception as e:  # noqa
@@ -332,6 +587,32 @@ class Project:
             help='file to store some cahces',
             default='.yaost.cache',
         )
+        parser.add_argument(
+            '--scad-modules',
+            action=argparse.BooleanOptionalAction,
+            help='emit repeated subtrees once as scad modules, enabled by default for stl builds',
+            default=None,
+        )
+        parser.add_argument(
+            '--scad-multmatrix',
+            action=argparse.BooleanOptionalAction,
+            help='emit chains of affine transformations as one multmatrix, enabled by default for stl builds',
+            default=None,
+        )
+        parser.add_argument(
+            '--scad-simplify',
+            action=argparse.BooleanOptionalAction,
+            help='drop booleans which do not change the result, enabled by default for stl builds',
+            default=None,
+        )
+        include_help = 'process matching parts only, glob pattern or regex prefixed with `re:`'
+        parser.add_argument('--include', type=str, help=include_help, default='')
+        parser.add_argument(
+            '--artifact-store',
+            type=str,
+            help='directory of rendered files shared between checkouts, looked up by scad content',
+            default='',
+        )
         parser.add_argument('--force', action='store_true', help='force action', default=False)
         parser.add_argument('--debug', action='store_true', help='enable debug output', default=False)
         parser.set_defaults(func=lambda args: parser.print_help())
@@ -339,6 +620,17 @@ class Project:
 
         watch_parser = subparsers.add_parser('watch', help='watch project and rebuild scad files')
         watch_parser.set_defaults(func=self.watch)
+        watch_parser.add_argument(
+            '--debounce',
+            type=float,
+            help='seconds to wait for more changes before rebuild',
+            default=0.2,
+        )
+        watch_parser.add_argument(
+            '--poll',
+            action='store_true',
+            help='poll files instead of inotify, for network filesystems',
+        )
 
         build_scad_parser = subparsers.add_parser('build-scad', help='build scad files')
         build_scad_parser.set_defaults(func=self.build_scad)
@@ -347,9 +639,21 @@ class Project:
         build_stl_parser.set_defaults(func=self.build_stl)
 
         build_parser = subparsers.add_parser('build', help='build all files')
-        build_parser.add_argument('--include', type=str, help='regex to build specified models only', default='')
         build_parser.set_defaults(func=self.build)
 
+        for subparser in (watch_parser, build_scad_parser, build_stl_parser, build_parser):
+            # also accepted after subcommand, suppressed default keeps top level value
+            subparser.add_argument('--include', type=str, help=include_help, default=argparse.SUPPRESS)
+
+        for subparser in (build_scad_parser, build_stl_parser, build_parser):
+            subparser.add_argument(
+                '-j',
+                '--jobs',
+                type=int,
+                help='number of processes evaluating parts and running openscad at once',
+                default=1,
+            )
+
         args = parser.parse_args()
 
         loglevel = logging.INFO
@@ -0,0 +1,407 @@
+import hashlib
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class ChildrenBlock:
+    """Children of a multiple children node.
+
+    Children are serialized separately, optionally sorted and
+    deduplicated and then wrapped in curly braces when there
+    are more than one of them.
+    """
+
+    __slots__ = ('nodes', 'can_order', 'first_child_fixed', 'deduplicate')
+
+    def __init__(
+        self,
+        nodes,
+        can_order: bool = True,
+        first_child_fixed: bool = False,
+        deduplicate: bool = True,
+    ):
+        self.nodes = list(nodes)
+        self.can_order = can_order
+        self.first_child_fixed = first_child_fixed
+        self.deduplicate = deduplicate
+
+    def join(self, chunks: List[str]) -> str:
+        if self.can_order:
+            if self.first_child_fixed:
+                chunks = chunks[:1] + list(sorted(chunks[1:]))
+            else:
+                chunks = sorted(chunks)
+
+        if self.deduplicate:
+            tmp, chunks = chunks, []
+            if self.first_child_fixed:
+                chunks.extend(tmp[:1])
+                tmp = tmp[1:]
+
+            seen = set()
+            for chunk in tmp:
+                if chunk in seen:
+                    continue
+                seen.add(chunk)
+                chunks.append(chunk)
+
+        if not chunks:
+            return ''
+
+        if len(chunks) == 1:
+            return chunks[0]
+
+        return '{{{}}}'.format(''.join(chunks))
+
+
+def _part_children(parts) -> Iterator[object]:
+    for part in parts:
+        if isinstance(part, str):
+            continue
+        if isinstance(part, ChildrenBlock):
+            yield from part.nodes
+        else:
+            yield part
+
+
+def _digest_parts(parts) -> str:
+    h = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        if isinstance(part, str):
+            h.update(b's')
+            h.update(part.encode('utf-8'))
+        elif isinstance(part, ChildrenBlock):
+            keys = [child._structural_key for child in part.nodes]
+            if part.can_order:
+                if part.first_child_fixed:
+                    keys = keys[:1] + sorted(keys[1:])
+                else:
+                    keys.sort()
+            if part.deduplicate:
+                head, tail = (keys[:1], keys[1:]) if part.first_child_fixed else ([], keys)
+                keys = head + list(dict.fromkeys(tail))
+            h.update(b'c%d%d%d' % (part.can_order, part.first_child_fixed, part.deduplicate))
+            for key in keys:
+                h.update(key.encode('ascii'))
+        else:
+            h.update(b'n')
+            h.update(part._structural_key.encode('ascii'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def structural_key(node, get_parts: Optional[Callable] = None) -> str:
+    """Returns canonical structural key of node.
+
+    Key is a hash over scad parts of the node where child nodes are
+    replaced by their keys, so nodes with equal keys produce equal scad
+    code. Keys are computed bottom-up once and cached on nodes.
+    """
+    if node._structural_key is not None:
+        return node._structural_key
+
+    if get_parts is None:
+        get_parts = _scad_parts
+
+    parts: Dict[int, tuple] = {}
+    stack: List[Tuple[object, bool]] = [(node, False)]
+    while stack:
+        item, children_done = stack.pop()
+        if children_done:
+            item._structural_key = _digest_parts(parts.pop(id(item)))
+            continue
+        if item._structural_key is not None:
+            continue
+        item_parts = get_parts(item)
+        parts[id(item)] = item_parts
+        stack.append((item, True))
+        for child in _part_children(item_parts):
+            if child._structural_key is None:
+                stack.append((child, False))
+    return node._structural_key
+
+
+def _scad_parts(node) -> tuple:
+    return node._scad_parts()
+
+
+class _Capture:
+    """Collects rendered children of a block until all of them are done."""
+
+    __slots__ = ('block', 'chunks')
+
+    def __init__(self, block: ChildrenBlock):
+        self.block = block
+        self.chunks: List[str] = []
+
+
+class _Collect:
+    __slots__ = ('capture',)
+
+    def __init__(self, capture: _Capture):
+        self.capture = capture
+
+
+_BEGIN = object()
+
+
+class ScadSerializer:
+    """Serializes node trees into scad code.
+
+    With `modules=True` subtrees which are used more than once, either
+    as the same python object or as structurally equal objects, are
+    emitted once as `module m_<hash>(){...}` and called at every use
+    site, when the definition together with the calls is shorter than
+    the inlined code, which is at least `min_module_size` long. With
+    `multmatrix=True` chains of affine transformations are emitted as
+    a single `multmatrix()`, which is cheaper for openscad but harder
+    to read. With `simplify=True` booleans which do not change the
+    result, e.g. holes far from the solid, are not emitted.
+    """
+
+    module_prefix = 'm_'
+
+    def __init__(
+        self,
+        modules: bool = False,
+        min_module_size: int = 0,
+        multmatrix: bool = False,
+        simplify: bool = False,
+    ):
+        self._use_modules = modules
+        self._use_multmatrix = multmatrix
+        self._use_simplify = simplify
+        self._min_module_size = min_module_size
+        self._parts: Dict[int, Tuple[object, tuple]] = {}
+        self._module_names: Dict[str, str] = {}
+
+    def _get_parts(self, node) -> tuple:
+        if not self._use_modules:
+            return node._scad_parts()
+        # NOTE parts are cached together with the node itself to keep
+        # children alive, so ids are not reused during serialization
+        key = id(node)
+        cached = self._parts.get(key)
+        if cached is None:
+            cached = self._parts[key] = (node, tuple(node._scad_parts()))
+        return cached[1]
+
+    def iter_chunks(self, node, expand_module: bool = False) -> Iterator[str]:
+        """Yields scad code of node chunk by chunk.
+
+        Every node describes itself with `_scad_parts()` as a sequence of
+        strings, child nodes and children blocks, child nodes are expanded
+        in place. No intermediate string for a subtree is built, so the cost
+        is linear in the size of the output and no recursion is involved.
+        """
+        stack = [node]
+        # children of blocks have to be sorted by their code, so while
+        # a block is being rendered its chunks go to a buffer
+        buffers: List[List[str]] = []
+        module_names = self._module_names
+        while stack:
+            item = stack.pop()
+            if isinstance(item, _Capture):
+                item = item.block.join(item.chunks)
+
+            if isinstance(item, str):
+                if not item:
+                    continue
+                if buffers:
+                    buffers[-1].append(item)
+                else:
+                    yield item
+                continue
+
+            if item is _BEGIN:
+                buffers.append([])
+                continue
+
+            if isinstance(item, _Collect):
+                item.capture.chunks.append(''.join(buffers.pop()))
+                continue
+
+            if isinstance(item, ChildrenBlock):
+                capture = _Capture(item)
+                stack.append(capture)
+                for child in reversed(self._unique_children(item)):
+                    stack.append(_Collect(capture))
+                    stack.append(child)
+                    stack.append(_BEGIN)
+                continue
+
+            if module_names:
+                if expand_module:
+                    expand_module = False
+                else:
+                    name = module_names.get(item._structural_key)
+                    if name is not None:
+                        stack.append(f'{name}();')
+                        continue
+
+            stack.extend(reversed(self._get_parts(item)))
+
+    def render(self, node) -> str:
+        return ''.join(self.iter_chunks(node))
+
+    def iter_file_chunks(self, node) -> Iterator[str]:
+        """Yields module definitions followed by the code of node."""
+        if self._use_simplify:
+            from yaost.optimize import simplify_csg
+
+            node = simplify_csg(node)
+        if self._use_multmatrix:
+            from yaost.optimize import compose_affine
+
+            node = compose_affine(node)
+        if self._use_modules:
+            for name, module_node in self._find_modules(node):
+                yield f'module {name}(){{'
+                yield from self.iter_chunks(module_node, expand_module=True)
+                yield '}\n'
+        yield from self.iter_chunks(node)
+
+    def _unique_children(self, block: ChildrenBlock) -> list:
+        """Children of block without structural duplicates.
+
+        Equal keys guarantee equal code, so dropping duplicates before
+        rendering does not change the result of deduplication by code.
+        Keys are computed only when modules are collected, otherwise
+        already cached keys are used and the rest is deduplicated by code.
+        """
+        if not block.deduplicate or len(block.nodes) < 2:
+            return block.nodes
+
+        result = []
+        nodes = block.nodes
+        if block.first_child_fixed:
+            result.append(nodes[0])
+            nodes = nodes[1:]
+
+        seen = set()
+        for node in nodes:
+            key = node._structural_key
+            if key is None:
+                result.append(node)
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append(node)
+        return result
+
+    def _emitted_parts(self, node) -> Tuple[int, List[List[str]]]:
+        """Length of code of node itself and keys of its emitted children.
+
+        Children are grouped as they are joined: every block with more
+        than one child is wrapped in curly braces.
+        """
+        size = 0
+        groups = []
+        for part in self._get_parts(node):
+            if isinstance(part, str):
+                size += len(part)
+            elif isinstance(part, ChildrenBlock):
+                groups.append([child._structural_key for child in self._unique_children(part)])
+            else:
+                groups.append([part._structural_key])
+        return size, groups
+
+    def _find_modules(self, root) -> List[Tuple[str, object]]:
+        # NOTE key of a node may be cached by previous serialization
+        # while its parts, e.g. collapsed children, are built anew
+        root_key = structural_key(root, self._get_parts)
+
+        # distinct subtrees in post order, so children go before parents
+        nodes: Dict[str, object] = {}
+        emitted: Dict[str, Tuple[int, List[List[str]]]] = {}
+        order: List[str] = []
+        stack: List[Tuple[object, bool]] = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            key = structural_key(node, self._get_parts)
+            if children_done:
+                order.append(key)
+                continue
+            if key in nodes:
+                continue
+            nodes[key] = node
+            emitted[key] = self._emitted_parts(node)
+            stack.append((node, True))
+            for child in _part_children(self._get_parts(node)):
+                if child._structural_key not in nodes:
+                    stack.append((child, False))
+
+        name_size = len(self.module_prefix) + 16
+        call_size = name_size + len('();')
+        definition_size = name_size + len('module (){}\n')
+
+        def code_size(key, sizes, modules):
+            size, groups = emitted[key]
+            for group in groups:
+                size += sum(call_size if child in modules else sizes[child] for child in group)
+                if len(group) > 1:
+                    size += 2
+            return size
+
+        def use_counts(modules):
+            # code of a module is emitted once, the rest is inlined
+            # at every use site
+            counts = dict.fromkeys(order, 0)
+            counts[root_key] = 1
+            for key in reversed(order):
+                emissions = 1 if key in modules else counts[key]
+                for group in emitted[key][1]:
+                    for child in group:
+                        counts[child] += emissions
+            return counts
+
+        def pays_off(size, count):
+            if count < 2 or size < self._min_module_size:
+                return False
+            return definition_size + size + count * call_size < count * size
+
+        # subtrees are chosen bottom-up as if everything around them was
+        # inlined, then the ones which do not pay off with the final
+        # choice, e.g. used only inside another module, are inlined back
+        counts = use_counts(set())
+        modules = set()
+        sizes: Dict[str, int] = {}
+        for key in order:
+            sizes[key] = code_size(key, sizes, modules)
+            if key != root_key and pays_off(sizes[key], counts[key]):
+                modules.add(key)
+
+        while True:
+            sizes = {}
+            for key in order:
+                sizes[key] = code_size(key, sizes, modules)
+            counts = use_counts(modules)
+            rejected = {key for key in modules if not pays_off(sizes[key], counts[key])}
+            if not rejected:
+                break
+            modules -= rejected
+
+        # NOTE modules are visible everywhere in scad, but definitions
+        # read better when dependencies go first
+        result = []
+        for key in order:
+            if key not in modules:
+                continue
+            name = f'{self.module_prefix}{key[:16]}'
+            self._module_names[key] = name
+            result.append((name, nodes[key]))
+        return result
+
+def iter_scad_chunks(node, modules: bool = False, multmatrix: bool = False, simplify: bool = False) -> Iterator[str]:
+    return ScadSerializer(modules=modules, multmatrix=multmatrix, simplify=simplify).iter_file_chunks(node)
+
+
+def write_scad(node, fp: IO[str], modules: bool = False, multmatrix: bool = False, simplify: bool = False):
+    """Writes scad code of node into a file-like object."""
+    write = fp.write
+    for chunk in iter_scad_chunks(node, modules=modules, multmatrix=multmatrix, simplify=simplify):
+        write(chunk)
+
+
+def to_scad(node, modules: bool = False, multmatrix: bool = False, simplify: bool = False) -> str:
+    return ''.join(iter_scad_chunks(node, modules=modules, multmatrix=multmatrix, simplify=simplify))
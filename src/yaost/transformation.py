@@ -1,10 +1,14 @@
+import itertools
 from functools import reduce
-from typing import Iterable, Optional
+from typing import Iterable, Iterator, Optional
 
 from lazy import lazy
 
+from yaost import affine
 from yaost.base import BaseObject
 from yaost.bbox import BBox
+from yaost.serializer import ChildrenBlock, iter_scad_chunks
+from yaost.traversal import cache_bottom_up
 from yaost.util import full_arguments_line
 from yaost.vector import Vector
 
@@ -19,10 +23,44 @@ __all__ = [
 
 
 class BaseTransformation(BaseObject):
-    pass
+    @lazy
+    def origin(self):
+        # chains of transformations are walked in a loop, not recursively,
+        # leaf statistics of unions are collected by the same walk
+        cache_bottom_up(self, '_leaf_stats', _compute_origin, _origin_sources)
+        return self.__dict__['origin']
+
+    def _origin(self) -> Vector:
+        """Origin computed from origins of `_origin_sources()`."""
+        return Vector()
+
+    def _origin_sources(self) -> tuple:
+        return ()
+
+    @lazy
+    def bbox(self):
+        # boxes of deep trees are computed in a loop, not recursively
+        return cache_bottom_up(self, 'bbox', _compute_bbox, _bbox_sources)
+
+    def _bbox(self) -> BBox:
+        """Box computed from boxes of `_bbox_sources()`."""
+        return BBox.unknown()
+
+    def _bbox_sources(self) -> tuple:
+        return ()
+
+    def _scad_parts(self):
+        raise NotImplementedError
+
+    def to_scad(self):
+        return ''.join(iter_scad_chunks(self))
 
 
 class SingleChildTransformation(BaseTransformation):
+    # NOTE modifiers and extrusions apply to the child as a whole and are
+    # not moved into members of a collapsed union
+    __collapse_through__ = True
+
     def _clone_with_another_child(self, another_child: BaseObject):
         raise NotImplementedError
 
@@ -34,9 +72,25 @@ class SingleChildTransformation(BaseTransformation):
         for hole in self.child.holes():
             yield self._clone_with_another_child(hole)
 
-    def collapse(self, *classes_to_collapse):
-        for collapsed in self.child.collapse(*classes_to_collapse):
-            yield self._clone_with_another_child(collapsed)
+    def _tree_children(self):
+        return (self.child,)
+
+    def _origin_sources(self):
+        return (self.child,)
+
+    def _bbox_sources(self):
+        return (self.child,)
+
+    def _with_children(self, children):
+        result = self._copy()
+        result.child = children[0]
+        return result
+
+    def _collapse_steps(self, classes_to_collapse):
+        if not self.__collapse_through__:
+            return [self]
+        collapsed = yield self.child._collapse_step(classes_to_collapse)
+        return [self._clone_with_another_child(child) for child in collapsed]
 
 
 class MultipleChildrenTransformation(BaseTransformation):
@@ -44,47 +98,45 @@ class MultipleChildrenTransformation(BaseTransformation):
     __first_child_fixed__ = False
     __deduplicate__ = True
 
+    @classmethod
+    def _children_block(cls, nodes) -> ChildrenBlock:
+        return ChildrenBlock(
+            nodes,
+            can_order=cls.__can_order_children__,
+            first_child_fixed=cls.__first_child_fixed__,
+            deduplicate=cls.__deduplicate__,
+        )
+
     @classmethod
     def _maybe_list_to_scad(cls, nodes):
         nodes = list(nodes)
+        return cls._children_block(nodes).join([node.to_scad() for node in nodes])
 
-        chunks = [node.to_scad() for node in nodes]
-        if cls.__can_order_children__:
-            if cls.__first_child_fixed__:
-                chunks = chunks[:1] + list(sorted(chunks[1:]))
-            else:
-                chunks.sort()
-
-        if cls.__deduplicate__:
-            tmp, chunks = chunks, []
-            if cls.__first_child_fixed__:
-                chunks.append(tmp[0])
-                tmp = tmp[1:]
+    def _tree_children(self):
+        return self.children
 
-            seen = set()
-            for chunk in tmp:
-                if chunk in seen:
-                    continue
-                seen.add(chunk)
-                chunks.append(chunk)
+    def _bbox_sources(self):
+        return tuple(self.children)
 
-        if not chunks:
-            return ''
-
-        if len(chunks) == 1:
-            return chunks[0]
-
-        return '{{{}}}'.format(''.join(chunks))
-
-    def _children_to_scad(self):
-        return self._maybe_list_to_scad(self.children)
+    def _with_children(self, children):
+        result = self._copy()
+        result.children = list(children)
+        return result
 
-    def collapse(self, *classes_to_collapse):
-        if isinstance(self, classes_to_collapse):
-            for child in self.children:
-                yield from child.collapse(*classes_to_collapse)
-        else:
-            yield self
+    def _collapse_steps(self, classes_to_collapse):
+        if not isinstance(self, classes_to_collapse):
+            return [self]
+
+        # nested steps return fresh lists, so list of the first child is
+        # extended in place and left deep `a + b + c` chains stay linear
+        result = None
+        for child in self.children:
+            collapsed = yield child._collapse_step(classes_to_collapse)
+            if result is None:
+                result = collapsed
+            else:
+                result.extend(collapsed)
+        return [] if result is None else result
 
 
 class Translate(SingleChildTransformation):
@@ -103,28 +155,36 @@ class Translate(SingleChildTransformation):
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(self._vector, another_child, clone=self._clone)
 
-    def collapse(self, *classes_to_collapse):
-        for collapsed in self.child.collapse(*classes_to_collapse):
-            if isinstance(collapsed, Translate) and self._clone == collapsed._clone:
-                yield self.__class__(
-                    self._vector + collapsed._vector,
-                    collapsed.child,
+    def _collapse_steps(self, classes_to_collapse):
+        result = []
+        for collapsed in (yield self.child._collapse_step(classes_to_collapse)):
+            if isinstance(collapsed, Translate) and not self._clone and not collapsed._clone:
+                result.append(
+                    self.__class__(
+                        self._vector + collapsed._vector,
+                        collapsed.child,
+                    )
                 )
             else:
-                yield self._clone_with_another_child(collapsed)
+                result.append(self._clone_with_another_child(collapsed))
+        return result
 
-    @lazy
-    def origin(self):
+    def _origin(self):
         result = self.child.origin + self._vector
         if self._clone:
             result = (result + self.child.origin) / 2
         return result
 
-    @lazy
-    def bbox(self):
-        # TODO add correct bbox
-        result = self.child.bbox + self._vector
-        return result
+    def _bbox(self):
+        return _affine_bbox(self)
+
+    def _bbox_sources(self):
+        return _affine_bbox_sources(self)
+
+    def _transform_matrix(self):
+        if not affine.is_numeric(self._vector):
+            return None
+        return affine.translation(self._vector)
 
     @property
     def x(self):
@@ -138,13 +198,16 @@ class Translate(SingleChildTransformation):
     def z(self):
         return self._vector.z
 
-    def to_scad(self):
-        child_str = self.child.to_scad()
+    def _scad_parts(self):
         translate_str = f'translate({full_arguments_line([self._vector])})'
-        result = f'{translate_str}{child_str}'
         if self._clone:
-            result = f'union(){{{child_str}{result}}}'
-        return result
+            return ('union(){', self.child, translate_str, self.child, '}')
+        return (translate_str, self.child)
+
+    def _affine_matrix(self):
+        if self._clone:
+            return None
+        return self._transform_matrix()
 
     def __repr__(self):
         return f'<Translate({self._vector})>'
@@ -168,8 +231,7 @@ class Rotate(SingleChildTransformation):
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(self._vector, self._center, another_child, clone=self._clone)
 
-    @lazy
-    def origin(self):
+    def _origin(self):
         result = (self.child.origin - self._center).rotate(
             self._vector.x, self._vector.y, self._vector.z
         ) + self._center
@@ -177,10 +239,11 @@ class Rotate(SingleChildTransformation):
             result = (result + self.child.origin) / 2
         return result
 
-    @lazy
-    def bbox(self):
-        # TODO fix this
-        return self.child.bbox
+    def _bbox(self):
+        return _affine_bbox(self)
+
+    def _bbox_sources(self):
+        return _affine_bbox_sources(self)
 
     @property
     def x(self):
@@ -194,18 +257,22 @@ class Rotate(SingleChildTransformation):
     def z(self):
         return self._vector.z
 
-    def to_scad(self):
+    def _scad_parts(self):
         rotate_str = f'rotate({full_arguments_line([self._vector])})'
-        child_str = self.child.to_scad()
-        if self._center:
-            translate1_str = f'translate({full_arguments_line([-self._center])})'
-            translate2_str = f'translate({full_arguments_line([self._center])})'
-            result = f'{translate2_str}{rotate_str}{translate1_str}{child_str}'
-        else:
-            result = f'{rotate_str}{child_str}'
+        return _centered_scad_parts(rotate_str, self._center, self.child, self._clone)
+
+    def _matrix_at_origin(self):
+        return affine.rotation(self._vector)
+
+    def _transform_matrix(self):
+        if not affine.is_numeric(self._vector, self._center):
+            return None
+        return affine.centered(self._matrix_at_origin(), self._center)
+
+    def _affine_matrix(self):
         if self._clone:
-            result = f'union(){{{child_str}{result}}}'
-        return result
+            return None
+        return self._transform_matrix()
 
 
 class Union(MultipleChildrenTransformation):
@@ -215,23 +282,27 @@ class Union(MultipleChildrenTransformation):
         label: Optional[str] = None,
     ):
         self.children = list(children)
-
-        flat_children = list(self.collapse(Union, Hull))
-        self.origin = reduce(lambda x, y: x + y.origin, flat_children, Vector()) / len(flat_children)
-        # TODO calculate bbox properly
-        self.bbox = BBox()
         self.label = label
 
-    def to_scad(self):
+    def _origin(self):
+        return _mean_leaf_origin(self)
+
+    def _origin_sources(self):
+        return tuple(self.children)
+
+    def _bbox(self):
+        return BBox.empty().union(*(child.bbox for child in self.children))
+
+    def _scad_parts(self):
         children = list(self.collapse(Union))
 
         if len(children) == 0:
-            return ''
+            return ()
 
         if len(children) == 1:
-            return children[0].to_scad()
+            return (children[0],)
 
-        return f'union(){self._maybe_list_to_scad(children)}'
+        return ('union()', self._children_block(children))
 
 
 class Minkowski(MultipleChildrenTransformation):
@@ -241,12 +312,23 @@ class Minkowski(MultipleChildrenTransformation):
         label: Optional[str] = None,
     ):
         children = list(children)
-        self.bbox = BBox()
         self.label = label
         self.children = children
 
-    def to_scad(self):
-        return f'minkowski(){self._children_to_scad()}'
+    def _bbox(self):
+        if not self.children:
+            return BBox.empty()
+        bboxes = [child.bbox for child in self.children]
+        if any(bbox.is_empty for bbox in bboxes):
+            return BBox.empty()
+        # minkowski sum of boxes is a box of summed corners
+        return BBox(
+            reduce(lambda x, y: x + y, (bbox.vmin for bbox in bboxes)),
+            reduce(lambda x, y: x + y, (bbox.vmax for bbox in bboxes)),
+        )
+
+    def _scad_parts(self):
+        return ('minkowski()', self._children_block(self.children))
 
 
 class Hull(MultipleChildrenTransformation):
@@ -256,15 +338,20 @@ class Hull(MultipleChildrenTransformation):
         label: Optional[str] = None,
     ):
         self.children = list(children)
-        flat_children = list(self.collapse(Union, Hull))
-        self.origin = reduce(lambda x, y: x + y.origin, flat_children, Vector()) / len(flat_children)
-        # TODO calculate bbox properly
-        self.bbox = BBox()
         self.label = label
 
-    def to_scad(self):
+    def _origin(self):
+        return _mean_leaf_origin(self)
+
+    def _origin_sources(self):
+        return tuple(self.children)
+
+    def _bbox(self):
+        return BBox.empty().union(*(child.bbox for child in self.children))
+
+    def _scad_parts(self):
         children = self.collapse(Union, Hull)
-        return f'hull(){self._maybe_list_to_scad(children)}'
+        return ('hull()', self._children_block(children))
 
 
 class Intersection(MultipleChildrenTransformation):
@@ -274,16 +361,25 @@ class Intersection(MultipleChildrenTransformation):
         label: Optional[str] = None,
     ):
         self.children = list(children)
-        flat_children = list(self.collapse(Intersection))
-        # TODO calculate bbox properly
-        self.bbox = BBox()
         self.label = label
+
+    def _origin(self):
         # TODO calculate origin properly
-        self.origin = reduce(lambda x, y: x + y.origin, flat_children, Vector()) / len(flat_children)
+        flat_children = self._origin_sources()
+        return reduce(lambda x, y: x + y.origin, flat_children, Vector()) / len(flat_children)
 
-    def to_scad(self):
+    def _origin_sources(self):
+        return tuple(self.collapse(Intersection))
+
+    def _bbox(self):
+        return BBox.unknown().intersection(*(child.bbox for child in self._bbox_sources()))
+
+    def _bbox_sources(self):
+        return tuple(self.collapse(Intersection))
+
+    def _scad_parts(self):
         children = self.collapse(Intersection)
-        return f'intersection(){self._maybe_list_to_scad(children)}'
+        return ('intersection()', self._children_block(children))
 
 
 class Difference(MultipleChildrenTransformation):
@@ -297,11 +393,21 @@ class Difference(MultipleChildrenTransformation):
         self.children = list(children)
         assert len(self.children) > 1
 
-        # TODO calculate origin properly
-        self.origin = children[0].origin
-        self.bbox = children[0].bbox
         self.label = label
 
+    def _origin(self):
+        # TODO calculate origin properly
+        return self.children[0].origin
+
+    def _origin_sources(self):
+        return (self.children[0],)
+
+    def _bbox(self):
+        return self.children[0].bbox
+
+    def _bbox_sources(self):
+        return (self.children[0],)
+
     def solids(self):
         for solid in self.children[0].solids():
             yield from solid.collapse(Union)
@@ -312,19 +418,18 @@ class Difference(MultipleChildrenTransformation):
         for hole in self.children[1:]:
             yield from hole.collapse(Union)
 
-    def collapse(self, *classes_to_collapse):
-        if isinstance(self, classes_to_collapse):
-            yield self.children[0]
-
-            for child in self.children[1:]:
-                yield from child.collapse(Union)
+    def _collapse_steps(self, classes_to_collapse):
+        if not isinstance(self, classes_to_collapse):
+            return [self]
 
-        else:
-            yield self
+        result = [self.children[0]]
+        for child in self.children[1:]:
+            result.extend((yield child._collapse_step((Union,))))
+        return result
 
-    def to_scad(self):
+    def _scad_parts(self):
         children = self.collapse(Difference)
-        return f'difference(){self._maybe_list_to_scad(children)}'
+        return ('difference()', self._children_block(children))
 
 
 class Join(MultipleChildrenTransformation):
@@ -338,49 +443,61 @@ class Join(MultipleChildrenTransformation):
         self.children = list(children)
         assert len(self.children) > 1
 
-        # TODO calculate origin properly
-        self.origin = self.children[0].origin
-        self.bbox = self.children[0].bbox
         self.label = label
 
-    def collapse(self, *classes_to_collapse):
-        if isinstance(self, classes_to_collapse):
-            holes = []
-            solids = []
+    def _origin(self):
+        # TODO calculate origin properly
+        return self.children[0].origin
+
+    def _origin_sources(self):
+        return (self.children[0],)
 
-            solids.extend(self.children[0].collapse(Union))
+    def _bbox(self):
+        # holes are cut from solids only, so solids give the box
+        chunks = self._bbox_sources()
+        if not chunks:
+            return BBox.empty()
+        return chunks[0].bbox
 
-            for child in self.children[1:]:
-                for subchild in child.collapse(Union):
-                    chunks = list(subchild.collapse(Difference))
-                    if not chunks:
-                        continue
-                    solids.extend(chunks[:1])
-                    holes.extend(chunks[1:])
+    def _bbox_sources(self):
+        return tuple(itertools.islice(self.collapse(Join), 1))
 
-            if len(solids) > 1:
-                solids = [Union(solids)]
+    def _collapse_steps(self, classes_to_collapse):
+        if not isinstance(self, classes_to_collapse):
+            return [self]
 
-            yield from solids
-            yield from holes
+        holes = []
+        solids = []
 
-        else:
-            yield self
+        solids.extend((yield self.children[0]._collapse_step((Union,))))
 
-    def to_scad(self):
+        for child in self.children[1:]:
+            for subchild in (yield child._collapse_step((Union,))):
+                chunks = yield subchild._collapse_step((Difference,))
+                if not chunks:
+                    continue
+                solids.extend(chunks[:1])
+                holes.extend(chunks[1:])
+
+        if len(solids) > 1:
+            solids = [Union(solids)]
+
+        return solids + holes
+
+    def _scad_parts(self):
         chunks = list(self.collapse(Join))
         solids = chunks[:1]
         holes = chunks[1:]
 
         if not solids:
-            return ''
+            return ()
 
         if not holes:
-            return solids[0].to_scad()
+            return (solids[0],)
 
         children = solids + holes
 
-        return f'difference(){self._maybe_list_to_scad(children)}'
+        return ('difference()', self._children_block(children))
 
 
 class Mirror(SingleChildTransformation):
@@ -402,8 +519,7 @@ class Mirror(SingleChildTransformation):
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(self._vector, self._center, another_child, clone=self._clone)
 
-    @lazy
-    def origin(self):
+    def _origin(self):
         result = (self.child.origin - self._center).mirror(
             self._vector.x,
             self._vector.y,
@@ -413,10 +529,11 @@ class Mirror(SingleChildTransformation):
             result = (result + self.child.origin) / 2
         return result
 
-    @lazy
-    def bbox(self):
-        # TODO fix this
-        return self.child.bbox
+    def _bbox(self):
+        return _affine_bbox(self)
+
+    def _bbox_sources(self):
+        return _affine_bbox_sources(self)
 
     @property
     def x(self):
@@ -424,24 +541,28 @@ class Mirror(SingleChildTransformation):
 
     @property
     def y(self):
-        return self._vector.x
+        return self._vector.y
 
     @property
     def z(self):
         return self._vector.z
 
-    def to_scad(self):
+    def _scad_parts(self):
         mirror_str = f'mirror({full_arguments_line([self._vector])})'
-        child_str = self.child.to_scad()
-        if self._center:
-            translate1_str = f'translate({full_arguments_line([-self._center])})'
-            translate2_str = f'translate({full_arguments_line([self._center])})'
-            result = f'{translate2_str}{mirror_str}{translate1_str}{child_str}'
-        else:
-            result = f'{mirror_str}{child_str}'
+        return _centered_scad_parts(mirror_str, self._center, self.child, self._clone)
+
+    def _matrix_at_origin(self):
+        return affine.mirroring(self._vector)
+
+    def _transform_matrix(self):
+        if not affine.is_numeric(self._vector, self._center):
+            return None
+        return affine.centered(self._matrix_at_origin(), self._center)
+
+    def _affine_matrix(self):
         if self._clone:
-            result = f'union(){{{child_str}{result}}}'
-        return result
+            return None
+        return self._transform_matrix()
 
 
 class Scale(SingleChildTransformation):
@@ -462,8 +583,7 @@ class Scale(SingleChildTransformation):
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(self._vector, self._center, another_child, clone=self._clone)
 
-    @lazy
-    def origin(self):
+    def _origin(self):
         result = (self.child.origin - self._center).scale(
             self._vector.x,
             self._vector.y,
@@ -473,10 +593,11 @@ class Scale(SingleChildTransformation):
             result = (result + self.child.origin) / 2
         return result
 
-    @lazy
-    def bbox(self):
-        # TODO fix this
-        return self.child.bbox
+    def _bbox(self):
+        return _affine_bbox(self)
+
+    def _bbox_sources(self):
+        return _affine_bbox_sources(self)
 
     @property
     def x(self):
@@ -484,27 +605,103 @@ class Scale(SingleChildTransformation):
 
     @property
     def y(self):
-        return self._vector.x
+        return self._vector.y
 
     @property
     def z(self):
         return self._vector.z
 
-    def to_scad(self):
+    def _scad_parts(self):
         transform_str = f'scale({full_arguments_line([self._vector])})'
-        child_str = self.child.to_scad()
-        if self._center:
-            translate1_str = f'translate({full_arguments_line([-self._center])})'
-            translate2_str = f'translate({full_arguments_line([self._center])})'
-            result = f'{translate2_str}{transform_str}{translate1_str}{child_str}'
-        else:
-            result = f'{transform_str}{child_str}'
+        return _centered_scad_parts(transform_str, self._center, self.child, self._clone)
+
+    def _matrix_at_origin(self):
+        return affine.scaling(self._vector)
+
+    def _transform_matrix(self):
+        if not affine.is_numeric(self._vector, self._center):
+            return None
+        return affine.centered(self._matrix_at_origin(), self._center)
+
+    def _affine_matrix(self):
+        if self._clone:
+            return None
+        return self._transform_matrix()
+
+
+class MultMatrix(SingleChildTransformation):
+    def __init__(
+        self,
+        matrix: affine.Matrix,
+        child: BaseObject,
+        clone: bool = False,
+        label: Optional[str] = None,
+        replaced: Optional[tuple] = None,
+    ):
+        self.label = label
+        self.child = child
+        self._clone = clone
+        self._matrix = matrix
+        # statements of the chain this matrix stands for, they are
+        # emitted instead of the matrix when they are shorter
+        self._replaced = replaced
+
+    def _clone_with_another_child(self, another_child: BaseObject):
+        return self.__class__(self._matrix, another_child, clone=self._clone, replaced=self._replaced)
+
+    def _transform_matrix(self):
+        if not affine.is_numeric(*self._matrix):
+            return None
+        return self._matrix
+
+    def _affine_matrix(self):
         if self._clone:
-            result = f'union(){{{child_str}{result}}}'
+            return None
+        return self._transform_matrix()
+
+    def _collapse_steps(self, classes_to_collapse):
+        result = []
+        for collapsed in (yield self.child._collapse_step(classes_to_collapse)):
+            matrix = collapsed._affine_matrix()
+            if matrix is None or self._clone:
+                result.append(self._clone_with_another_child(collapsed))
+            else:
+                replaced = _join_statements(_statements(self), _statements(collapsed))
+                result.append(self.__class__(affine.multiply(self._matrix, matrix), collapsed.child, replaced=replaced))
         return result
 
+    def _origin(self):
+        result = affine.apply(self._matrix, self.child.origin)
+        if self._clone:
+            result = (result + self.child.origin) / 2
+        return result
+
+    def _bbox(self):
+        return _affine_bbox(self)
+
+    def _bbox_sources(self):
+        return _affine_bbox_sources(self)
+
+    def _scad_parts(self):
+        matrix = self._matrix
+        child = self.child
+        if self._clone:
+            # transformed copy of an affine child goes with one matrix
+            child_matrix = child._affine_matrix()
+            if child_matrix is not None:
+                matrix = affine.multiply(matrix, child_matrix)
+                child = child.child
+
+        statement = _matrix_statement(matrix)
+        if self._clone:
+            return ('union(){', self.child, statement, child, '}')
+        if self._replaced is not None and self._replaced[0] < len(statement):
+            return tuple(_iter_statements(self._replaced)) + (child,)
+        return (statement, child) if statement else (child,)
+
 
 class LinearExtrude(SingleChildTransformation):
+    __collapse_through__ = False
     is_body = True
 
     def __init__(
@@ -517,10 +714,6 @@ class LinearExtrude(SingleChildTransformation):
         fn: Optional[float] = None,
         label: Optional[str] = None,
     ):
-        # TODO make proper bbox
-        self.bbox = child.bbox
-        self.origin = child.origin.tz(z=height / 2)
-
         self.label = label
         self.child = child
         self._height = height
@@ -529,33 +722,46 @@ class LinearExtrude(SingleChildTransformation):
         self._slices = slices
         self._fn = fn
 
+    def _origin(self):
+        return self.child.origin.tz(z=self._height / 2)
+
+    def _bbox(self):
+        bbox = self.child.bbox
+        if bbox.is_empty or bbox.is_unknown:
+            return bbox
+        vmin, vmax = bbox.vmin, bbox.vmax
+        if self._twist:
+            # twisted profile stays inside a circle around z axis
+            r = max(corner.norm for corner in bbox.corners())
+            vmin, vmax = Vector(-r, -r), Vector(r, r)
+        return BBox(Vector(vmin.x, vmin.y, 0), Vector(vmax.x, vmax.y, self._height))
+
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(
             self._height,
-            self.child,
+            another_child,
             self._convexity,
             self._twist,
             self._slices,
             self._fn,
         )
 
-    def to_scad(self):
-        return 'linear_extrude({}){}'.format(
-            full_arguments_line(
-                (),
-                {
-                    'height': self._height,
-                    'convexity': self._convexity,
-                    'twist': self._twist,
-                    'slices': self._slices,
-                    '$fn': self._fn,
-                },
-            ),
-            self.child.to_scad(),
+    def _scad_parts(self):
+        args = full_arguments_line(
+            (),
+            {
+                'height': self._height,
+                'convexity': self._convexity,
+                'twist': self._twist,
+                'slices': self._slices,
+                '$fn': self._fn,
+            },
         )
+        return (f'linear_extrude({args})', self.child)
 
 
 class RotateExtrude(SingleChildTransformation):
+    __collapse_through__ = False
     is_body = True
 
     def __init__(
@@ -566,25 +772,32 @@ class RotateExtrude(SingleChildTransformation):
         fn: Optional[float] = None,
         label: Optional[str] = None,
     ):
-        # TODO make proper bbox
-        self.bbox = child.bbox
-        self.origin = Vector()
-
         self.label = label
         self.child = child
         self._angle = angle
         self._convexity = convexity
         self._fn = fn
 
+    def _origin(self):
+        return Vector()
+
+    def _bbox(self):
+        bbox = self.child.bbox
+        if bbox.is_empty or bbox.is_unknown:
+            return bbox
+        # profile x becomes radius, profile y becomes z
+        r = max(abs(bbox.vmin.x), abs(bbox.vmax.x))
+        return BBox(Vector(-r, -r, bbox.vmin.y), Vector(r, r, bbox.vmax.y))
+
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(
-            self.child,
+            another_child,
             angle=self._angle,
             convexity=self._convexity,
             fn=self._fn,
         )
 
-    def to_scad(self):
+    def _scad_parts(self):
         args = full_arguments_line(
             args=(),
             kwargs=dict(
@@ -593,7 +806,7 @@ class RotateExtrude(SingleChildTransformation):
                 fn=self._fn,
             ),
         )
-        return f'rotate_extrude({args}){self.child.to_scad()}'
+        return (f'rotate_extrude({args})', self.child)
 
 
 class GenericSingleTransformation(SingleChildTransformation):
@@ -607,10 +820,6 @@ class GenericSingleTransformation(SingleChildTransformation):
         **kwargs,
     ):
         self.label = label
-
-        # TODO make proper bbox
-        self.bbox = child.bbox
-        self.origin = child.origin
         self.is_body = is_body
 
         self.child = child
@@ -618,6 +827,25 @@ class GenericSingleTransformation(SingleChildTransformation):
         self._args = args
         self._kwargs = kwargs
 
+    def _origin(self):
+        return self.child.origin
+
+    def _bbox(self):
+        if self._name in ('color', 'render'):
+            return self.child.bbox
+        if self._name == 'projection':
+            bbox = self.child.bbox
+            if bbox.is_empty or bbox.is_unknown:
+                return bbox
+            return BBox(Vector(bbox.vmin.x, bbox.vmin.y), Vector(bbox.vmax.x, bbox.vmax.y))
+        if self._name == 'offset':
+            delta = self._kwargs.get('r', self._kwargs.get('delta', 0))
+            bbox = self.child.bbox
+            if bbox.is_empty or bbox.is_unknown or delta is None:
+                return bbox
+            return BBox(bbox.vmin - Vector(delta, delta), bbox.vmax + Vector(delta, delta))
+        return BBox.unknown()
+
     def _clone_with_another_child(self, another_child: BaseObject):
         return self.__class__(
             self._name,
@@ -627,18 +855,14 @@ class GenericSingleTransformation(SingleChildTransformation):
             **self._kwargs,
         )
 
-    def to_scad(self):
-        return '{}({}){}'.format(
-            self._name,
-            full_arguments_line(
-                self._args,
-                self._kwargs,
-            ),
-            self.child.to_scad(),
-        )
+    def _scad_parts(self):
+        args = full_arguments_line(self._args, self._kwargs)
+        return (f'{self._name}({args})', self.child)
 
 
 class Modifier(SingleChildTransformation):
+    __collapse_through__ = False
+
     def __init__(
         self,
         name: str,
@@ -647,18 +871,198 @@ class Modifier(SingleChildTransformation):
     ):
         self.label = label
 
-        # TODO make proper bbox
-        self.bbox = child.bbox
-        self.origin = child.origin
-
         self.child = child
         self._name = name
 
+    def _origin(self):
+        return self.child.origin
+
+    def _bbox(self):
+        return self.child.bbox
+
     def _clone_with_another_child(self, another_child: BaseObject):
-        return self.__class__(self._name, self.child)
+        return self.__class__(self._name, another_child)
+
+    def _scad_parts(self):
+        return (self._name, self.child)
+
+
+def _affine_chain(node: BaseObject):
+    """Returns matrix and base node such that node is base transformed by matrix.
+
+    Base is the first node down the tree which is not a plain affine
+    transformation. Result is cached on every node of the chain, chains
+    are walked in a loop, so long chains do not recurse.
+    """
+    chain = []
+    while True:
+        cached = node.__dict__.get('_affine_chain')
+        if cached is not None:
+            matrix, base = cached
+            break
+        node_matrix = node._affine_matrix()
+        if node_matrix is None:
+            matrix, base = affine.IDENTITY, node
+            break
+        chain.append((node, node_matrix))
+        node = node.child
+
+    for chain_node, node_matrix in reversed(chain):
+        matrix = affine.multiply(node_matrix, matrix)
+        chain_node.__dict__['_affine_chain'] = (matrix, base)
+    return matrix, base
+
+
+def _matrix_statement(matrix: affine.Matrix) -> str:
+    if not affine.is_translation(matrix):
+        return f'multmatrix({full_arguments_line([affine.as_list(matrix)])})'
+    if matrix[0][3] or matrix[1][3] or matrix[2][3]:
+        vector = Vector(matrix[0][3], matrix[1][3], matrix[2][3])
+        return f'translate({full_arguments_line([vector])})'
+    return ''
+
+
+def _statements(node: SingleChildTransformation) -> tuple:
+    """Statements a non-cloning affine node emits above its child.
+
+    Result is a tree of `(size, text)` leaves and `(size, outer, inner)`
+    pairs, so statements of long chains are joined without copying.
+    """
+    if isinstance(node, MultMatrix) and node._replaced is not None:
+        return node._replaced
+    text = ''.join(part for part in node._scad_parts() if isinstance(part, str))
+    return (len(text), text)
+
+
+def _join_statements(outer: tuple, inner: tuple) -> tuple:
+    return (outer[0] + inner[0], outer, inner)
+
+
+def _iter_statements(statements: tuple) -> Iterator[str]:
+    stack = [statements]
+    while stack:
+        item = stack.pop()
+        if len(item) == 2:
+            yield item[1]
+        else:
+            stack.append(item[2])
+            stack.append(item[1])
 
-    def to_scad(self):
-        return f'{self._name}{self.child.to_scad()}'
+
+def _affine_bbox(node: SingleChildTransformation) -> BBox:
+    node_matrix = node._transform_matrix()
+    if node_matrix is None:
+        # transformation with variables may move child anywhere
+        return BBox.unknown()
+    matrix, base = _affine_chain(node.child)
+    points = base._bbox_points()
+
+    def transformed(m):
+        # points of the base give exact box, its box is only a bound
+        if points is not None:
+            return BBox.from_points(affine.apply(m, p) for p in points)
+        return base.bbox.transform(m)
+
+    result = transformed(affine.multiply(node_matrix, matrix))
+    if node._clone:
+        result = result | transformed(matrix)
+    return result
+
+
+def _affine_bbox_sources(node: SingleChildTransformation) -> tuple:
+    if node._transform_matrix() is None:
+        return ()
+    return (_affine_chain(node.child)[1],)
+
+
+def _compute_bbox(node: BaseTransformation) -> BBox:
+    return node._bbox()
+
+
+def _bbox_sources(node: BaseTransformation) -> tuple:
+    # bodies get their box in constructor or from their points
+    return tuple(source for source in node._bbox_sources() if isinstance(source, BaseTransformation))
+
+
+def _compute_origin(node: BaseTransformation) -> tuple:
+    """Caches origin of node unless it is set already, returns leaf statistics.
+
+    Origins and statistics of `_origin_sources()` are cached by then, so
+    nothing here walks the tree.
+    """
+    origin = node.__dict__.get('origin')
+    if origin is None:
+        origin = node.__dict__['origin'] = node._origin()
+    return _leaf_stats(node, origin)
+
+
+def _origin_sources(node: BaseTransformation) -> tuple:
+    # bodies get their origin in constructor
+    return tuple(source for source in node._origin_sources() if isinstance(source, BaseTransformation))
+
+
+class _OriginProbe(BaseObject):
+    def __init__(self, origin: Vector):
+        self.label = None
+        self.origin = origin
+
+
+def _cached_leaf_stats(node: BaseObject) -> tuple:
+    if isinstance(node, BaseTransformation):
+        return node.__dict__['_leaf_stats']
+    return 1, node.origin
+
+
+def _children_leaf_stats(node: MultipleChildrenTransformation) -> tuple:
+    count, total = 0, Vector()
+    for child in node.children:
+        child_count, child_total = _cached_leaf_stats(child)
+        count += child_count
+        total = total + child_total
+    return count, total
+
+
+def _mean_leaf_origin(node: MultipleChildrenTransformation) -> Vector:
+    count, total = _children_leaf_stats(node)
+    if count == 0:
+        return Vector()
+    return total / count
+
+
+def _leaf_stats(node: BaseTransformation, origin: Vector) -> tuple:
+    """Count and sum of origins of nodes produced by `node.collapse(Union, Hull)`.
+
+    Statistics are cached on every node, so appending to a union with
+    `+=` costs constant time.
+    """
+    if isinstance(node, (Union, Hull)):
+        return _children_leaf_stats(node)
+
+    if isinstance(node, SingleChildTransformation):
+        count, total = _cached_leaf_stats(node.child)
+        if count == 0:
+            return 0, Vector()
+        if count == 1:
+            return 1, origin
+        # collapse clones node over every leaf below it and origins of
+        # transformations are affine in origin of child, so transformed
+        # mean of leaves is mean of transformed leaves
+        probe = node._clone_with_another_child(_OriginProbe(total / count))
+        return count, probe._origin() * count
+
+    return 1, origin
+
+
+def _centered_scad_parts(transform_str: str, center: Vector, child: BaseObject, clone: bool):
+    if center:
+        translate1_str = f'translate({full_arguments_line([-center])})'
+        translate2_str = f'translate({full_arguments_line([center])})'
+        parts = (translate2_str, transform_str, translate1_str, child)
+    else:
+        parts = (transform_str, child)
+    if clone:
+        parts = ('union(){', child) + parts + ('}',)
+    return parts
 
 
 def difference(*args, label: Optional[str] = None):
@@ -0,0 +1,115 @@
+"""Non-recursive tree traversal.
+
+All walks over node trees go through the functions below. They use an
+explicit stack, so tree depth is limited by memory only and not by
+python recursion limit.
+"""
+from types import GeneratorType
+from typing import Callable, Generator, Iterator, List, Optional, Tuple
+
+
+def iter_preorder(root) -> Iterator:
+    """Yields node before its children, children in order."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node._tree_children()))
+
+
+def iter_postorder(root, unique: bool = False) -> Iterator:
+    """Yields children in order before their parent.
+
+    With `unique=True` every object is yielded once even if it is shared
+    by several parents.
+    """
+    seen = set()
+    stack: List[Tuple[object, bool]] = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            yield node
+            continue
+        if unique:
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node._tree_children()))
+
+
+def cache_bottom_up(root, key: str, compute: Callable, expand: Callable):
+    """Computes value cached in node `__dict__[key]` for root.
+
+    Value of a node is computed by `compute(node)` after values of all
+    nodes returned by `expand(node)` are cached, already cached nodes
+    are not walked into.
+    """
+    value = root.__dict__.get(key)
+    if value is not None:
+        return value
+
+    stack: List[Tuple[object, bool]] = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            node.__dict__[key] = compute(node)
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(expand(node)) if key not in child.__dict__)
+    return root.__dict__[key]
+
+
+def find_first(root, callback: Callable):
+    """Returns first not None result of callback in preorder."""
+    for node in iter_preorder(root):
+        result = callback(node)
+        if result is not None:
+            return result
+    return None
+
+
+def find_path(root, predicate: Callable) -> Optional[list]:
+    """Returns path from the first node matching predicate up to the root.
+
+    Nodes are checked in preorder, descendants of matched node are not
+    visited.
+    """
+    stack: List[Tuple[object, Optional[tuple]]] = [(root, None)]
+    while stack:
+        node, parent_link = stack.pop()
+        link = (node, parent_link)
+        if predicate(node):
+            result = []
+            while link is not None:
+                result.append(link[0])
+                link = link[1]
+            return result
+        stack.extend((child, link) for child in reversed(node._tree_children()))
+    return None
+
+
+def run_steps(steps: Generator):
+    """Runs recursive algorithm written as a generator of steps.
+
+    A step generator yields another step generator when it needs a result
+    of a nested call and receives that result back from `yield`, its own
+    result is the value it returns. Anything else yielded is a result
+    known in advance and is sent back as is. Generators are driven from a
+    plain list, so nesting depth costs no python stack.
+    """
+    stack = [steps]
+    value = None
+    while stack:
+        try:
+            nested = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+        if isinstance(nested, GeneratorType):
+            stack.append(nested)
+            value = None
+        else:
+            value = nested
+    return value
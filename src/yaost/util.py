@@ -1,24 +1,142 @@
-from typing import Any
+import re
+from typing import Any, List, Optional
 
 from yaost.variable import Variable
 from yaost.vector import Vector
 
+DEFAULT_PRECISION = 6
 
-def nice_float(v: float) -> str:
-    result = f'{v:.6f}'
-    result = result.rstrip('0').rstrip('.')
+_TRAILING_ZEROS_RE = re.compile(r'\.?0+(?=[,\]]|$)')
+
+
+def nice_float(v: float, precision: int = DEFAULT_PRECISION) -> str:
+    result = f'{v:.{precision}f}'
+    if precision:
+        result = result.rstrip('0').rstrip('.')
     return result
 
 
-def _serialize_argument(v: Any) -> str:
+_CLOSE = object()
+_COMMA = object()
+
+
+def _numeric_template(v: Any, number_format: str, pieces: List[str], values: list) -> bool:
+    """Collects printf-style template of (nested) numeric sequence.
+
+    Returns False when sequence contains anything except numbers,
+    vectors and other sequences.
+    """
+    stack = [v]
+    while stack:
+        item = stack.pop()
+        if item is _COMMA:
+            pieces.append(',')
+            continue
+        if item is _CLOSE:
+            pieces.append(']')
+            continue
+
+        kind = type(item)
+        if kind is float or kind is int:
+            pieces.append(number_format)
+            values.append(item)
+        elif kind is list or kind is tuple:
+            pieces.append('[')
+            stack.append(_CLOSE)
+            for idx in range(len(item) - 1, -1, -1):
+                stack.append(item[idx])
+                if idx:
+                    stack.append(_COMMA)
+        elif kind is Vector:
+            stack.append((item.x, item.y, item.z))
+        elif isinstance(item, bool) or isinstance(item, str):
+            return False
+        elif hasattr(item, 'tolist'):
+            stack.append(item.tolist())
+        elif isinstance(item, (int, float)):
+            pieces.append(number_format)
+            values.append(float(item))
+        else:
+            return False
+    return True
+
+
+_NUMBER_TYPES = frozenset((int, float))
+
+
+def _rows_template(rows: Any, number_format: str, pieces: List[str], values: list) -> bool:
+    """Fast path for sequences of flat numeric rows (points, faces)."""
+    row_templates = {}
+    for row in rows:
+        kind = type(row)
+        if kind is Vector:
+            row = (row.x, row.y, row.z)
+        elif kind is not list and kind is not tuple:
+            return False
+        size = len(row)
+        template = row_templates.get(size)
+        if template is None:
+            template = row_templates[size] = '[{}]'.format(','.join([number_format] * size))
+        pieces.append(template)
+        values.extend(row)
+    return set(map(type, values)) <= _NUMBER_TYPES
+
+
+def serialize_array(v: Any, precision: int = DEFAULT_PRECISION) -> Optional[str]:
+    """Serializes numeric data in one pass.
+
+    Accepts numbers, nested lists and tuples of numbers or vectors, numpy
+    arrays, `array.array` and memoryviews (shaped memoryviews produce
+    nested lists). All numbers are formatted with one printf operation and
+    trailing zeros are stripped with one regex pass, result is the same as
+    `nice_float` applied to every number.
+
+    Returns None when data contains non numeric values.
+    """
+    if hasattr(v, 'tolist') and not isinstance(v, Vector):
+        v = v.tolist()
+
+    number_format = f'%.{precision}f'
+    pieces: List[str] = []
+    values: list = []
+    if isinstance(v, (list, tuple)) and _rows_template(v, number_format, pieces, values):
+        result = '[{}]'.format(','.join(pieces) % tuple(values))
+    else:
+        pieces.clear()
+        values.clear()
+        if not _numeric_template(v, number_format, pieces, values):
+            return None
+        result = ''.join(pieces) % tuple(values)
+    if precision:
+        result = _TRAILING_ZEROS_RE.sub('', result)
+    return result
+
+
+def _serialize_argument(v: Any, precision: int = DEFAULT_PRECISION) -> str:
+    kind = type(v)
+    if kind is bool:
+        return 'true' if v else 'false'
+    if kind is float or kind is int:
+        return nice_float(v, precision)
+    if kind is str:
+        return f'"{v}"'
+
+    if isinstance(v, (list, tuple, Vector)) or hasattr(v, 'tolist'):
+        chunk = serialize_array(v, precision)
+        if chunk is not None:
+            return chunk
+        if isinstance(v, Vector):
+            v = [v.x, v.y, v.z]
+        elif not isinstance(v, (list, tuple)):
+            v = v.tolist()
+            if not isinstance(v, list):
+                return _serialize_argument(v, precision)
+        return '[{}]'.format(','.join(_serialize_argument(vv, precision) for vv in v))
+
     if isinstance(v, bool):
         chunk = 'true' if v else 'false'
     elif isinstance(v, (int, float)):
-        chunk = nice_float(v)
-    elif isinstance(v, Vector):
-        chunk = _serialize_argument([v.x, v.y, v.z])
-    elif isinstance(v, (list, tuple)):
-        chunk = '[{}]'.format(','.join(_serialize_argument(vv) for vv in v))
+        chunk = nice_float(v, precision)
     elif isinstance(v, str):
         chunk = f'"{v}"'
     elif isinstance(v, Variable):
@@ -28,10 +146,10 @@ def _serialize_argument(v: Any) -> str:
     return chunk
 
 
-def full_arguments_line(args=(), kwargs=()) -> str:
+def full_arguments_line(args=(), kwargs=(), precision: int = DEFAULT_PRECISION) -> str:
     chunks = []
     for arg in args:
-        chunk = _serialize_argument(arg)
+        chunk = _serialize_argument(arg, precision)
         chunks.append(chunk)
 
     for key in sorted(kwargs):
@@ -41,5 +159,5 @@ def full_arguments_line(args=(), kwargs=()) -> str:
         key_str = key
         if key_str == 'fn':
             key_str = '$fn'
-        chunks.append(f'{key_str}={_serialize_argument(value)}')
+        chunks.append(f'{key_str}={_serialize_argument(value, precision)}')
     return ','.join(chunks)
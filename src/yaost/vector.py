@@ -1,17 +1,33 @@
 # coding: utf-8
 from math import atan2, cos, pi, sin, sqrt
 
-from lazy import lazy
-
 
 class Vector:
+    """Immutable 3d vector.
+
+    Vectors are never changed in place, all operations return new
+    vectors. Slots keep instances small, there are lots of them in
+    polyhedrons.
+    """
+
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x=None, y=None, z=None):
         if isinstance(x, list) and len(x) == 3 and y is None and z is None:
             x, y, z = x[0], x[1], x[2]
 
-        self.x = x or 0
-        self.y = y or 0
-        self.z = z or 0
+        object.__setattr__(self, 'x', x or 0)
+        object.__setattr__(self, 'y', y or 0)
+        object.__setattr__(self, 'z', z or 0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self):
+        return (Vector, (self.x, self.y, self.z))
 
     @classmethod
     def com_for_children(cls, children):
@@ -138,29 +154,30 @@ class Vector:
         else:
             return self.t(-xc, -yc, 0).rotate(az=az).t(xc, yc, 0)
 
-    @lazy
+    @property
     def norm(self):
         return sqrt(self.x**2 + self.y**2 + self.z**2)
 
-    @lazy
+    @property
     def normed(self):
-        if self.norm == 0:
+        norm = self.norm
+        if norm == 0:
             return Vector(0, 0, 0)
-        return Vector(self.x / self.norm, self.y / self.norm, self.z / self.norm)
+        return Vector(self.x / norm, self.y / norm, self.z / norm)
 
-    @lazy
+    @property
     def normal(self):
         return Vector(-self.y, self.x, self.z)
 
-    @lazy
+    @property
     def as_array(self):
         return [self.x, self.y, self.z]
 
-    @lazy
+    @property
     def as_array_2d(self):
         return [self.x, self.y]
 
-    @lazy
+    @property
     def alpha(self):
         return atan2(self.x, self.y)
 
@@ -193,8 +210,9 @@ class Vector:
         if v2.norm == 0:
             return self
 
-        new_length = v1.dot(v2) / v1.norm
-        result = Vector(pl.x + new_length * v1.x / v1.norm, pl.y + new_length * v1.y / v1.norm)
+        v1_norm = v1.norm
+        new_length = v1.dot(v2) / v1_norm
+        result = Vector(pl.x + new_length * v1.x / v1_norm, pl.y + new_length * v1.y / v1_norm)
         return result
 
     def __sub__(a, b):
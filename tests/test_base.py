@@ -1,4 +1,9 @@
-# import pytest
+import array
+
+import pytest
+
+from yaost.util import nice_float, serialize_array
+
 from .common import Node
 
 
@@ -37,3 +42,23 @@ def test_union_collapse():
     xyz = xy + z
     assert 'union(){x();y();}' == xy.to_scad()
     assert 'union(){x();y();z();}' == xyz.to_scad()
+
+
+def test_bulk_serialization_matches_nice_float():
+    values = [0, 1, -1, 0.5, 1e-7, -1e-7, 100, 10.5, 1.05, 123456.7890123, 4.9999999]
+    points = [[v, -v, v * 3] for v in values]
+    expected = '[{}]'.format(','.join('[{}]'.format(','.join(nice_float(v) for v in p)) for p in points))
+    assert expected == serialize_array(points)
+
+    flat = array.array('d', [v for p in points for v in p])
+    assert expected == serialize_array(memoryview(flat).cast('B').cast('d', (len(points), 3)))
+
+    assert '[1.235,2]' == serialize_array([1.23456789, 2.0], precision=3)
+    assert serialize_array([1, 'x']) is None
+
+
+def test_numpy_serialization():
+    np = pytest.importorskip('numpy')
+
+    n = Node('polyhedron', np.array([[0.5, 0, 1], [2, 3, 4]]), faces=np.array([[0, 1, 1]]))
+    assert 'polyhedron([[0.5,0,1],[2,3,4]],faces=[[0,1,1]]);' == n.to_scad()
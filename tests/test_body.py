@@ -1,6 +1,6 @@
 # import pytest
 
-from yaost.body import Cylinder, Cube
+from yaost.body import Cylinder, Cube, polyhedron, sphere, square
 
 
 def test_cube():
@@ -31,3 +31,11 @@ def test_cylinder():
 
     cylinder = Cylinder(r1=1, r2=2, h=3).t(1)
     assert 'translate([1,0,0])cylinder(h=3,r1=1,r2=2);' == cylinder.to_scad()
+
+
+def test_bodies_bbox():
+    assert Cube(1, 2, 3).bbox.as_tuple() == (0, 0, 0, 1, 2, 3)
+    assert sphere(d=4).bbox.as_tuple() == (-2, -2, -2, 2, 2, 2)
+    assert square([2, 4], center=True).bbox.as_tuple() == (-1, -2, 0, 1, 2, 0)
+    points = [[0, 0, 0], [1, 0, 0], [0, 2, 0], [0, 0, 3]]
+    assert polyhedron(points, [[0, 1, 2]]).bbox.as_tuple() == (0, 0, 0, 1, 2, 3)
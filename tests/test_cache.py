@@ -0,0 +1,53 @@
+import json
+import sqlite3
+
+from yaost.cache import BuildCache
+
+
+def test_records_are_written_on_commit(tmp_path):
+    path = str(tmp_path / 'cache')
+    cache = BuildCache(path)
+    cache.set_record('a.scad', 'scad', 'build', 3)
+    cache.set_version('project', 3)
+    assert cache.get_record('a.scad') == {'scad_hash': 'scad', 'build_hash': 'build', 'version': 3}
+
+    with BuildCache(path) as other:
+        assert other.get_record('a.scad') is None
+        assert other.get_version('project') == 0
+
+    cache.commit()
+    cache.close()
+    with BuildCache(path) as other:
+        assert other.get_record('a.scad') == {'scad_hash': 'scad', 'build_hash': 'build', 'version': 3}
+        assert other.get_version('project') == 3
+
+
+def test_json_cache_is_imported(tmp_path):
+    path = tmp_path / 'cache'
+    path.write_text(json.dumps({
+        'scad_cache': {
+            'a.scad': {'scad_hash': 'x', 'build_hash': 'y', 'version': 7},
+            'old.scad': 'not a record',
+        },
+        'projects': {'project': {'version': 7}},
+    }))
+
+    with BuildCache(str(path)) as cache:
+        assert cache.get_record('a.scad') == {'scad_hash': 'x', 'build_hash': 'y', 'version': 7}
+        assert cache.get_record('old.scad') is None
+        assert cache.get_version('project') == 7
+
+    with sqlite3.connect(str(path)) as connection:
+        assert connection.execute('SELECT count(*) FROM scad_cache').fetchone() == (1,)
+
+
+def test_file_hashes_are_keyed_by_stat(tmp_path):
+    path = str(tmp_path / 'cache')
+    with BuildCache(path) as cache:
+        cache.set_file_hash('a.stl', (10, 20, 30), 'hash')
+        assert cache.get_file_hash('a.stl', (10, 20, 30)) == 'hash'
+
+    with BuildCache(path) as cache:
+        assert cache.get_file_hash('a.stl', (10, 20, 30)) == 'hash'
+        assert cache.get_file_hash('a.stl', (10, 21, 30)) is None
+        assert cache.get_file_hash('b.stl', (10, 20, 30)) is None
@@ -12,3 +12,16 @@ def test_body_ctx():
 def test_origin_ctx():
     cube = Cube(2, 2, 2).t(ctx.center)
     assert 'translate([-1,0,0])cube([2,2,2]);' == cube.to_scad()
+
+
+def test_label_lookup_after_wrapping():
+    base = Cube(1, 2, 3, label='base')
+    model = base.t(ctx.by_label.base.x).rz(90)
+    assert model.q.base is base
+    assert model.l('base').y == 2
+    assert model.t(ctx.by_label.base.y).to_scad() == 'translate([2,0,0])rotate([0,0,90])translate([1,0,0])cube([1,2,3]);'
+
+    other = Cube(4, 4, 4, label='base')
+    assert (model + other).q.base is base
+    assert (other + model).q.base is other
+    assert (other + model).body is other
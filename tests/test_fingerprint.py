@@ -0,0 +1,53 @@
+import functools
+import os
+
+from yaost.body import Cube
+from yaost.fingerprint import Fingerprinter
+
+
+def make_box(size):
+    return Cube(size, size, size)
+
+
+def test_fingerprint_follows_code_and_settings():
+    fingerprinter = Fingerprinter()
+
+    def part():
+        return make_box(1)
+
+    def other_part():
+        return make_box(2)
+
+    assert fingerprinter.fingerprint(part, 3.0) == fingerprinter.fingerprint(part, 3.0)
+    assert fingerprinter.fingerprint(part, 3.0) != fingerprinter.fingerprint(part, 1.0)
+    assert fingerprinter.fingerprint(part) != fingerprinter.fingerprint(other_part)
+    assert fingerprinter.fingerprint(functools.partial(make_box, 1)) != fingerprinter.fingerprint(
+        functools.partial(make_box, 2)
+    )
+
+
+def test_fingerprint_follows_bound_values():
+    fingerprinter = Fingerprinter()
+    fingerprints = set()
+    for size in (1, 2, 2.0):
+        fingerprints.add(fingerprinter.fingerprint(lambda: make_box(size)))
+        fingerprints.add(fingerprinter.fingerprint(lambda size=size: make_box(size)))
+    assert len(fingerprints) == 6
+
+
+def test_parts_bound_to_unknown_values_are_not_fingerprinted():
+    fingerprinter = Fingerprinter()
+    model = Cube(1, 1, 1)
+    assert fingerprinter.fingerprint(model) is None
+    assert fingerprinter.fingerprint(lambda: model) is None
+    assert fingerprinter.fingerprint(lambda: os.path) is not None
+
+
+def test_fingerprint_covers_yaost_and_user_modules():
+    fingerprinter = Fingerprinter()
+    closure = fingerprinter._module_closure(__name__)
+    assert __name__ in closure
+    assert 'yaost.body' in closure
+    assert 'yaost.base' in closure
+    assert 'os' not in closure
+    assert 'functools' not in closure
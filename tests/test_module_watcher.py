@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+import pytest
+
+from yaost.module_watcher import ModuleWatcher
+
+
+class Calls:
+    def __init__(self, first_call_duration=0.0):
+        self.calls = []
+        self.cancelled = []
+        self._first_call_duration = first_call_duration
+        self._event = threading.Event()
+
+    def __call__(self, paths, cancelled):
+        self.calls.append(sorted(paths))
+        self._event.set()
+        deadline = time.monotonic() + (0.0 if self.cancelled else self._first_call_duration)
+        while time.monotonic() < deadline and not cancelled():
+            time.sleep(0.01)
+        self.cancelled.append(cancelled())
+
+    def wait(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.calls) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.calls) >= count
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watched(request, tmp_path):
+    script = tmp_path / 'model.py'
+    script.write_text('x = 1\n')
+
+    def make_watcher(callback, debounce=0.3):
+        watcher = ModuleWatcher(
+            str(script),
+            callback,
+            debounce=debounce,
+            poll_interval=0.02,
+            use_inotify=request.param == 'inotify',
+        )
+        if request.param == 'inotify' and watcher.wm is None:
+            pytest.skip('inotify is not available')
+        watcher.start_watching()
+        request.addfinalizer(watcher.stop_watching)
+        return watcher
+
+    return script, make_watcher
+
+
+def test_burst_of_changes_gives_one_call(watched):
+    script, make_watcher = watched
+    calls = Calls()
+    make_watcher(calls)
+
+    for i in range(5):
+        script.write_text(f'x = {i}\n')
+        time.sleep(0.03)
+    # atomic save through a temporary file
+    temporary = script.with_name('model.py.tmp')
+    temporary.write_text('x = 100\n')
+    os.replace(temporary, script)
+
+    assert calls.wait(1)
+    time.sleep(0.5)
+    assert calls.calls == [[str(script)]]
+
+
+def test_newer_changes_cancel_running_call(watched):
+    script, make_watcher = watched
+    calls = Calls(first_call_duration=3.0)
+    watcher = make_watcher(calls, debounce=0.05)
+
+    script.write_text('x = 2\n')
+    assert calls.wait(1)
+    generation = watcher.generation
+    script.write_text('x = 3\n')
+    assert calls.wait(2)
+    assert calls.cancelled[0] is True
+    assert watcher.generation > generation
+
+
+def test_modules_created_after_import_are_watched(watched):
+    script, make_watcher = watched
+    script.write_text('import helper\n')
+    calls = Calls()
+    make_watcher(calls, debounce=0.05)
+
+    helper = script.with_name('helper.py')
+    helper.write_text('y = 1\n')
+    assert calls.wait(1)
+    helper.write_text('y = 2\n')
+    assert calls.wait(2)
+    assert calls.calls == [[str(helper)], [str(helper)]]
@@ -0,0 +1,58 @@
+import ast
+
+from yaost import packagefinder
+from yaost.packagefinder import PackageFinder
+
+FILES = {
+    'model.py': '''
+import os
+import pkg.deep.mod
+from helpers import size
+from pkg import sub
+
+raise SystemExit('script must not be executed')
+
+
+def part():
+    import lazy
+''',
+    'helpers.py': 'size = 1\n',
+    'lazy.py': '',
+    'unused.py': '',
+    'pkg/__init__.py': 'from .inner import thing\n',
+    'pkg/inner.py': 'thing = 1\n',
+    'pkg/sub.py': '',
+    'pkg/deep/__init__.py': '',
+    'pkg/deep/mod.py': 'from .. import inner\n',
+}
+
+
+def make_project(tmp_path):
+    for name, text in FILES.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+def relative_files(finder, tmp_path):
+    files = finder.get_files_list(str(tmp_path / 'model.py'))
+    return sorted(str(path.relative_to(tmp_path)) for path in map(tmp_path.joinpath, files))
+
+
+def test_imports_are_found_without_running_script(tmp_path):
+    make_project(tmp_path)
+    assert relative_files(PackageFinder(), tmp_path) == sorted(set(FILES) - {'unused.py'})
+
+
+def test_only_changed_files_are_parsed_again(tmp_path, monkeypatch):
+    make_project(tmp_path)
+    parsed = []
+    parse = ast.parse
+    monkeypatch.setattr(packagefinder.ast, 'parse', lambda source, filename: parsed.append(filename) or parse(source))
+    finder = PackageFinder()
+    relative_files(finder, tmp_path)
+    parsed.clear()
+
+    (tmp_path / 'helpers.py').write_text('import unused\nsize = 2\n')
+    assert relative_files(finder, tmp_path) == sorted(FILES)
+    assert parsed == [str(tmp_path / 'helpers.py'), str(tmp_path / 'unused.py')]
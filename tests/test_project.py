@@ -0,0 +1,410 @@
+import argparse
+import importlib.util
+import os
+import sys
+
+import pytest
+
+from yaost import project as project_module
+from yaost.body import Cube, Cylinder
+from yaost.cache import BuildCache
+from yaost.project import Project, part_selected
+
+FAKE_OPENSCAD = '''#!{python}
+import sys
+import time
+
+if sys.argv[1] == '--version':
+    print('OpenSCAD version fake', file=sys.stderr)
+    sys.exit(0)
+scad_path, output_path = sys.argv[1], sys.argv[3]
+with open('openscad.log', 'a') as fp:
+    fp.write(scad_path + '\\n')
+with open(scad_path) as fp:
+    code = fp.read()
+print('rendering', scad_path)
+time.sleep(0.1)
+if 'broken' in scad_path:
+    sys.exit(2)
+with open(output_path, 'w') as fp:
+    fp.write(code)
+'''
+
+
+@pytest.fixture
+def openscad(tmp_path, monkeypatch):
+    bin_directory = tmp_path / 'bin'
+    bin_directory.mkdir()
+    path = bin_directory / 'openscad'
+    path.write_text(FAKE_OPENSCAD.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_directory) + os.pathsep + os.environ['PATH'])
+    monkeypatch.chdir(tmp_path)
+    return path
+
+
+EVALUATED = []
+
+
+def fingerprinted_box():
+    EVALUATED.append('box')
+    return Cube(1, 2, 3)
+
+
+def fingerprinted_ball():
+    EVALUATED.append('ball')
+    return Cylinder(d=2, h=1)
+
+
+def make_args(tmp_path, **kwargs):
+    defaults = dict(
+        scad_directory=str(tmp_path / 'scad'),
+        stl_directory=str(tmp_path / 'stl'),
+        build_directory=str(tmp_path / 'build'),
+        cache_file=str(tmp_path / 'cache.json'),
+        scad_modules=None,
+        scad_multmatrix=None,
+        scad_simplify=None,
+        force=False,
+        debug=False,
+        include='',
+        jobs=4,
+        artifact_store='',
+    )
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_parallel_build(tmp_path, openscad):
+    project = Project('test')
+    for i in range(6):
+        project.add_part(f'part-{i}', Cube(1, 1, i + 1))
+    args = make_args(tmp_path)
+
+    project.build(args)
+
+    for i in range(6):
+        assert (tmp_path / 'build' / f'part-{i}.stl').read_text().endswith(f'cube([1,1,{i + 1}]);\n')
+    with BuildCache(args.cache_file) as cache:
+        assert cache.get_version('test') == 1
+        for i in range(6):
+            assert cache.get_record(str(tmp_path / 'scad' / 'test' / f'part-{i}.scad'))['version'] == 1
+
+
+def test_stl_builds_compose_affine_chains(tmp_path, openscad):
+    project = Project('test')
+    project.add_part('chain', Cube(1, 2, 3).t(1).rotate(z=90).t(y=2).mx(xc=5))
+    args = make_args(tmp_path)
+
+    project.build(args)
+    assert (tmp_path / 'build' / 'chain.stl').read_text().endswith(
+        'multmatrix([[0,1,0,10],[1,0,0,3],[0,0,1,0],[0,0,0,1]])cube([1,2,3]);\n'
+    )
+    project.build_scad(make_args(tmp_path / 'readable'))
+    assert (tmp_path / 'readable' / 'scad' / 'test' / 'chain.scad').read_text().endswith(
+        'translate([5,0,0])mirror([1,0,0])translate([-5,0,0])translate([0,2,0])rotate([0,0,90])translate([1,0,0])cube([1,2,3]);\n'
+    )
+
+
+def test_failed_parts_do_not_hide_others(tmp_path, openscad, caplog):
+    project = Project('test')
+    project.add_part('broken-a', Cube(1, 1, 1))
+    project.add_part('good', Cube(2, 2, 2))
+    project.add_part('broken-b', Cube(3, 3, 3))
+    args = make_args(tmp_path)
+
+    with pytest.raises(SystemExit) as e:
+        project.build(args)
+    assert e.value.code == 1
+    assert (tmp_path / 'build' / 'good.stl').exists()
+    assert 'failed to build broken-a, broken-b' in caplog.text
+
+    with BuildCache(args.cache_file) as cache:
+        assert cache.get_record(str(tmp_path / 'scad' / 'test' / 'good.scad')) is not None
+        assert cache.get_record(str(tmp_path / 'scad' / 'test' / 'broken-a.scad')) is None
+
+
+def test_parts_evaluated_once(tmp_path, openscad):
+    project = Project('test')
+    calls = []
+
+    @project.add_part
+    def counted():
+        calls.append(1)
+        return Cube(1, 1, 1)
+
+    parts = project.build_scad(make_args(tmp_path, jobs=1))
+    assert [part.name for part in parts] == ['counted']
+    assert parts[0].scad_hash == project._get_files_hash(parts[0].scad_file_path)
+    assert len(calls) == 1
+
+    project.build(make_args(tmp_path, jobs=1))
+    assert len(calls) == 2
+    assert (tmp_path / 'build' / 'counted.stl').exists()
+
+
+def test_include_applied_before_evaluation(tmp_path):
+    project = Project('test')
+    calls = []
+    for name in ('gear-a', 'gear-b', 'box'):
+        project.add_part(name, lambda name=name: calls.append(name) or Cube(1, 1, 1))
+
+    parts = project.build_scad(make_args(tmp_path, include='gear-*', jobs=1))
+    assert [part.name for part in parts] == ['gear-a', 'gear-b']
+    assert calls == ['gear-a', 'gear-b']
+    assert not (tmp_path / 'scad' / 'test' / 'box.scad').exists()
+
+    assert part_selected('box', 're:^(box|gear-b)$')
+    assert not part_selected('gear-a', 're:^(box|gear-b)$')
+    assert part_selected('Gears.small', 're:small')
+    assert part_selected('anything', '')
+
+
+def test_unchanged_scad_files_are_not_rewritten(tmp_path):
+    project = Project('test')
+    project.add_part('box', Cube(1, 1, 1))
+    args = make_args(tmp_path)
+
+    part, = project.build_scad(args)
+    assert part.scad_hash == project._get_files_hash(part.scad_file_path)
+    os.utime(part.scad_file_path, ns=(0, 0))
+
+    assert project.build_scad(args)[0].scad_hash == part.scad_hash
+    assert os.stat(part.scad_file_path).st_mtime_ns == 0
+
+    project.parts['box'] = Cube(2, 2, 2)
+    changed, = project.build_scad(args)
+    assert changed.scad_hash != part.scad_hash
+    assert os.stat(part.scad_file_path).st_mtime_ns != 0
+    assert os.listdir(tmp_path / 'scad' / 'test') == ['box.scad']
+
+
+def test_artifact_store_shared_between_checkouts(tmp_path, openscad):
+    store = str(tmp_path / 'store')
+    project = Project('test')
+    project.add_part('box', Cube(1, 2, 3))
+
+    first = make_args(tmp_path / 'first', artifact_store=store)
+    project.build(first)
+    assert len((tmp_path / 'openscad.log').read_text().splitlines()) == 1
+
+    # same geometry under another name in another checkout is not rendered again
+    project = Project('test')
+    project.add_part('renamed-box', Cube(1, 2, 3))
+    second = make_args(tmp_path / 'second', artifact_store=store)
+    project.build(second)
+    assert len((tmp_path / 'openscad.log').read_text().splitlines()) == 1
+    result = tmp_path / 'second' / 'build' / 'renamed-box.stl'
+    assert result.read_text() == (tmp_path / 'first' / 'build' / 'box.stl').read_text()
+    assert os.stat(result).st_nlink == 3
+
+    project.build(make_args(tmp_path / 'second', artifact_store=store, force=True))
+    assert len((tmp_path / 'openscad.log').read_text().splitlines()) == 2
+    assert os.stat(tmp_path / 'first' / 'build' / 'box.stl').st_nlink == 2
+    assert sorted(os.listdir(tmp_path / 'second' / 'build')) == ['renamed-box.stl']
+
+
+def test_unchanged_outputs_are_not_hashed_again(tmp_path, openscad, monkeypatch):
+    project = Project('test')
+    project.add_part('box', Cube(1, 2, 3))
+    args = make_args(tmp_path)
+    project.build(args)
+
+    hashed = []
+    files_hash = project._get_files_hash
+    monkeypatch.setattr(project, '_get_files_hash', lambda *names: hashed.extend(names) or files_hash(*names))
+    project.build(args)
+    project.build(args)
+    assert hashed == []
+
+    # changed result is hashed, rendered again and new one is hashed
+    result = tmp_path / 'build' / 'box.stl'
+    result.write_text('changed')
+    project.build(args)
+    assert hashed == [str(result)] * 2
+    assert len((tmp_path / 'openscad.log').read_text().splitlines()) == 2
+
+
+def test_parts_evaluated_in_processes(tmp_path, caplog):
+    project = Project('test')
+    pids = tmp_path / 'pids'
+
+    def part(size):
+        with open(pids, 'a') as fp:
+            fp.write(f'{os.getpid()}\n')
+        if size == 3:
+            raise ValueError('broken part')
+        return Cube(size, size, size)
+
+    for size in range(1, 6):
+        project.add_part(f'part-{size}', lambda size=size: part(size))
+
+    parallel = project.build_scad(make_args(tmp_path / 'parallel', jobs=3))
+    assert str(os.getpid()) not in pids.read_text().split()
+    assert [part.name for part in parallel] == ['part-1', 'part-2', 'part-4', 'part-5']
+    assert all(part.model is None and not part.is_2d for part in parallel)
+    assert 'failed to run model part-3' in caplog.text
+    assert 'broken part' in caplog.text
+
+    serial = project.build_scad(make_args(tmp_path / 'serial', jobs=1))
+    assert [part.scad_hash for part in serial] == [part.scad_hash for part in parallel]
+
+
+def test_interrupt_in_worker_stops_build(tmp_path):
+    project = Project('test')
+
+    def part(size):
+        if size == 2:
+            raise KeyboardInterrupt
+        return Cube(size, size, size)
+
+    for size in range(1, 6):
+        project.add_part(f'part-{size}', lambda size=size: part(size))
+
+    with pytest.raises(KeyboardInterrupt):
+        project.build_scad(make_args(tmp_path, jobs=2))
+
+
+def test_unchanged_parts_are_not_evaluated(tmp_path, openscad):
+    EVALUATED.clear()
+    project = Project('test')
+    project.add_part('box', fingerprinted_box)
+    project.add_part('ball', fingerprinted_ball)
+    args = make_args(tmp_path, jobs=1)
+
+    project.build(args)
+    assert sorted(EVALUATED) == ['ball', 'box']
+    project.build(args)
+    parts = project.build_scad(args, optimize=True)
+    assert sorted(EVALUATED) == ['ball', 'box']
+    assert [(part.name, part.model) for part in parts] == [('ball', None), ('box', None)]
+    assert len((tmp_path / 'openscad.log').read_text().splitlines()) == 2
+
+    # removed scad file, other settings and --force evaluate parts again
+    os.unlink(parts[1].scad_file_path)
+    project.build(args)
+    assert EVALUATED[2:] == ['box']
+    project._fn = 16
+    project.build(args)
+    assert sorted(EVALUATED[3:]) == ['ball', 'box']
+    project.build(make_args(tmp_path, jobs=1, force=True))
+    assert len(EVALUATED) == 7
+
+
+HOT_MODEL = '''
+from shapes import box_size
+from yaost import Project
+from yaost.body import Cube
+
+p = Project('hot')
+
+
+def log(name):
+    with open('evaluated.log', 'a') as fp:
+        fp.write(name + '\\n')
+
+
+@p.add_part
+def box():
+    log('box')
+    return Cube(box_size(), 1, 1)
+
+
+@p.add_part
+def plate():
+    log('plate')
+    return Cube(10, 10, 1)
+'''
+
+
+def test_watch_reloads_changed_modules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    shapes = tmp_path / 'shapes.py'
+    shapes.write_text('def box_size():\n    return 1\n')
+    script = tmp_path / 'model.py'
+    script.write_text(HOT_MODEL)
+    log = tmp_path / 'evaluated.log'
+    args = make_args(tmp_path, jobs=1)
+
+    try:
+        spec = importlib.util.spec_from_file_location(project_module._WATCHED_MODULE, script)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        project = module.p
+        project.build_scad(args)
+        assert log.read_text().split() == ['box', 'plate']
+
+        shapes.write_text('def box_size():\n    return 22\n')
+        project._reload(str(script), [str(shapes)])
+        project.build_scad(args)
+        assert log.read_text().split()[2:] == ['box']
+        assert 'cube([22,1,1]);' in (tmp_path / 'scad' / 'hot' / 'box.scad').read_text()
+
+        script.write_text(HOT_MODEL.replace('Cube(10, 10, 1)', 'Cube(10, 10, 333)'))
+        project._reload(str(script), [str(script)])
+        project.build_scad(args)
+        assert log.read_text().split()[3:] == ['plate']
+        assert 'cube([10,10,333]);' in (tmp_path / 'scad' / 'hot' / 'plate.scad').read_text()
+    finally:
+        sys.modules.pop('shapes', None)
+        sys.modules.pop(project_module._WATCHED_MODULE, None)
+
+
+def test_cancelled_build_keeps_finished_parts(tmp_path):
+    EVALUATED.clear()
+    project = Project('test')
+    project.add_part('box', fingerprinted_box)
+    project.add_part('ball', fingerprinted_ball)
+    args = make_args(tmp_path, jobs=1)
+
+    parts = project.build_scad(args, cancelled=lambda: True)
+    assert [part.name for part in parts] == ['ball']
+    assert EVALUATED == ['ball']
+
+    parts = project.build_scad(args)
+    assert [part.name for part in parts] == ['ball', 'box']
+    assert EVALUATED == ['ball', 'box']
+
+
+CLASS_MODEL = '''
+from yaost import Project
+from yaost.body import Cube
+
+p = Project('classes')
+
+
+class Parts:
+    SIZE = 10
+
+    @p.part
+    def box(self):
+        return Cube(self.SIZE, 1, 1)
+'''
+
+
+def test_class_attributes_are_fingerprinted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    script = tmp_path / 'model.py'
+    script.write_text(CLASS_MODEL)
+    args = make_args(tmp_path, jobs=1)
+    box = tmp_path / 'scad' / 'classes' / 'Parts.box.scad'
+
+    try:
+        spec = importlib.util.spec_from_file_location(project_module._WATCHED_MODULE, script)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        project = module.p
+        project.build_scad(args)
+        assert 'cube([10,1,1]);' in box.read_text()
+
+        script.write_text(CLASS_MODEL.replace('SIZE = 10', 'SIZE = 20'))
+        project._reload(str(script), [str(script)])
+        project.build_scad(args)
+        assert 'cube([20,1,1]);' in box.read_text()
+    finally:
+        sys.modules.pop(project_module._WATCHED_MODULE, None)
@@ -1,7 +1,12 @@
 # import pytest
+import io
+import sys
 
-from yaost import join
+from yaost import Variable, circle, cube, hull, interned, intersection, join, sphere, square
 from yaost.body import Cube, Cylinder
+from yaost.serializer import ScadSerializer, to_scad
+from yaost.transformation import Difference, Hull, Union
+from yaost.vector import Vector
 
 from .common import Node
 
@@ -114,3 +119,324 @@ def test_complex_optimization_case():
 
     result = (x + (y - z)) - a
     assert 'difference(){union(){difference(){y();z();}x();}a();}' == result.to_scad()
+
+
+def test_write_scad_streams_same_code():
+    x = Node('x')
+    y = Node('y')
+
+    result = (x.t(1).rz(30).mx(2, clone=True) + y) - x.s(2, 2, 2, xc=1)
+    fp = io.StringIO()
+    result.write_scad(fp)
+    assert result.to_scad() == fp.getvalue()
+    assert fp.getvalue().startswith('difference(){union(){')
+
+
+def test_shared_subtree_emitted_as_module():
+    hole = hull(Node('x'), Node('y', 'some long argument to make subtree big enough')).rz(30)
+    result = Node('a') - hole.tx(1) - hole.tx(2)
+
+    assert result.to_scad() == to_scad(result, modules=False)
+
+    code = to_scad(result, modules=True)
+    definition, main = code.split('\n')
+    assert definition.startswith('module m_')
+    assert definition.endswith('{rotate([0,0,30])hull(){x();y("some long argument to make subtree big enough");}}')
+    name = definition[len('module '):definition.index('(')]
+    assert main == f'difference(){{difference(){{a();translate([1,0,0]){name}();}}translate([2,0,0]){name}();}}'
+
+
+def test_modules_are_not_longer_than_inlined_code():
+    # pillars of rounded cube are shorter than their calls
+    result = cube(10, 10, 10, r=1)
+    assert to_scad(result, modules=True) == result.to_scad()
+
+    result = cube(10, 10, 10, r=1).mx(5, clone=True).tz(10, clone=True)
+    code = to_scad(result, modules=True)
+    assert 'module ' in code
+    assert len(code) < len(result.to_scad())
+
+    serializer = ScadSerializer(modules=True, min_module_size=len(code))
+    assert ''.join(serializer.iter_file_chunks(result)) == result.to_scad()
+
+
+def test_modules_count_uses_after_deduplication():
+    part = Node('y', 'some long argument to make subtree big enough')
+    result = Node('x') + part.tx(1) + part.tx(1)
+
+    assert to_scad(result, modules=True) == result.to_scad()
+
+
+def test_deep_trees_do_not_recurse():
+    depth = sys.getrecursionlimit() * 2
+
+    result = Node('x')
+    result.label = 'x'
+    for _ in range(depth):
+        result = result.t(1)
+    assert result.to_scad().startswith('translate([1,0,0])' * 10)
+    assert result.origin.x == depth
+    assert len(list(result.traverse_all())) == depth + 1
+    assert result.l('x').label == 'x'
+    assert len(result._get_body_stack()) == depth + 1
+
+    result = Node('a')
+    for _ in range(depth):
+        result -= Node('x').t(1)
+    assert result.to_scad().startswith('difference(){' * 10)
+    assert result.origin == Node('a').origin
+
+    result = Node('x').linear_extrude(1)
+    for _ in range(depth):
+        result = result.color('red')
+    assert result.origin.z == 0.5
+
+
+def test_origin_of_deep_mixed_chains():
+    depth = sys.getrecursionlimit() * 2
+
+    result = Cube(1, 1, 1)
+    for _ in range(depth):
+        result = (result * Cube(2, 2, 2)).color('red').hull()
+    assert (result.origin - Vector(1, 1, 1)).norm < 1e-9
+
+    result = Cube(2, 2, 2)
+    for _ in range(depth):
+        result = (result - Cube(1, 1, 1)).tx(1).mx(clone=True).debug() + Cube(2, 2, 2)
+    assert (result.origin - Vector(0.5, 1, 1)).norm < 1e-9
+
+
+def test_structural_equality():
+    x = Node('x')
+    a = (x.t(1) + Node('y')).rz(30)
+    b = (Node('x').t(1) + Node('y')).rz(30)
+    c = (Node('x').t(2) + Node('y')).rz(30)
+
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a.structural_key == b.structural_key
+    assert a != c
+    assert len({a, b, c}) == 2
+    assert Node('y') + Node('x') == Node('x') + Node('y')
+
+
+def test_interned_returns_same_instance():
+    table = {}
+    a = interned(Cube(1, 2, 3).t(1).rz(30), table)
+    b = interned(Cube(1, 2, 3).t(1).rz(30), table)
+    labelled = Cube(1, 2, 3, label='c')
+    c = Cube(1, 2, 3).t(1).rz(30)
+
+    assert a is b
+    assert a is not c
+    assert a == c
+    assert interned(labelled, table) is labelled
+    assert len(table) == 1
+
+
+def test_interning_is_explicit():
+    table = {}
+    a = interned(cube(10, 10, 10, r=1), table)
+    b = cube(10, 10, 10, r=1, label='b')
+    small = sphere(d=2)
+    big = sphere(r=2)
+
+    assert interned(cube(10, 10, 10, r=1), table) is a
+    assert interned(b, table) is b
+    assert a.children[0] is not b.children[0]
+    assert (a.label, b.label) == (None, 'b')
+    assert a.x == b.x == 10
+    assert (small.r, big.r) == (1, 2)
+    assert len(table) == 1
+
+
+def test_modules_are_stable_between_serializations():
+    # translates of unions are distributed over union children anew
+    # on every serialization
+    part = Node('x', 'some long argument to make subtree big enough').tx(1).mx(10, clone=True)
+    result = (part + Node('y')).tx(1).my(10, clone=True).hull()
+
+    first = to_scad(result, modules=True)
+    assert 'module ' in first
+    assert to_scad(result, modules=True) == first
+
+
+def test_cloning_translates_are_not_merged():
+    copies = Cube(1, 1, 1).t(1, clone=True).t(0, 2, clone=True)
+    result = copies + Cube(3, 3, 3)
+    # both copies used to be merged into one translate([1,2,0]) cube
+    assert result.to_scad() != 'union(){cube([3,3,3]);translate([1,2,0])cube([1,1,1]);}'
+    assert result.to_scad() == f'union(){{cube([3,3,3]);{copies.to_scad()}}}'
+    assert (Cube(1, 1, 1).t(1).t(0, 2) + Cube(3, 3, 3)).to_scad() == (
+        'union(){cube([3,3,3]);translate([1,2,0])cube([1,1,1]);}'
+    )
+
+
+def test_modifiers_and_extrusions_stay_on_collapsed_unions():
+    part = Cube(1, 1, 1) + Cube(2, 2, 2).tx(5)
+    code = 'union(){cube([1,1,1]);translate([5,0,0])cube([2,2,2]);}'
+    assert (part.show_only() + Cube(3, 3, 3).tz(9)).to_scad() == f'union(){{!{code}translate([0,0,9])cube([3,3,3]);}}'
+    assert (Cube(4, 4, 4) - part.background()).to_scad() == f'difference(){{cube([4,4,4]);%{code}}}'
+    assert (part.debug() + Cube(3, 3, 3)).to_scad() == f'union(){{#{code}cube([3,3,3]);}}'
+
+    profile = square([1, 1]) + square([2, 2]).tx(5)
+    code = 'union(){square([1,1]);translate([5,0,0])square([2,2]);}'
+    result = profile.linear_extrude(2).tz(1) + Cube(3, 3, 3)
+    assert result.to_scad() == f'union(){{cube([3,3,3]);translate([0,0,1])linear_extrude(height=2){code}}}'
+    result = profile.rotate_extrude(angle=90) + Cube(3, 3, 3)
+    assert result.to_scad() == f'union(){{cube([3,3,3]);rotate_extrude(angle=90){code}}}'
+
+
+def test_modifiers_and_extrusions_cloned_with_another_child():
+    # these used to return a copy of the original child
+    part = Cube(2, 2, 2, label='p').tx(3).debug().tz(1)
+    assert Cube(1, 1, 1).same_moves(part, 'p').to_scad() == 'translate([0,0,1])#translate([3,0,0])cube([1,1,1]);'
+    part = square([2, 2], label='p').linear_extrude(2).tz(3)
+    assert circle(r=1).same_moves(part, 'p').to_scad() == 'translate([0,0,3])linear_extrude(height=2)circle(r=1);'
+    part = square([2, 2], label='p').tx(3).rotate_extrude(angle=90)
+    assert circle(r=1).same_moves(part, 'p').to_scad() == 'rotate_extrude(angle=90)translate([3,0,0])circle(r=1);'
+
+    holes = (square([2, 2]) - circle(r=1)).linear_extrude(3).holes()
+    assert [hole.to_scad() for hole in holes] == ['linear_extrude(height=3)circle(r=1);']
+
+
+def test_affine_chain_emitted_as_multmatrix():
+    model = Cube(1, 2, 3).t(1).rotate(z=90).t(y=2).mx(xc=5)
+    assert to_scad(model, multmatrix=True) == 'multmatrix([[0,1,0,10],[1,0,0,3],[0,0,1,0],[0,0,0,1]])cube([1,2,3]);'
+    assert to_scad(Cube(1, 1, 1).t(1).t(2, 3), multmatrix=True) == 'translate([3,3,0])cube([1,1,1]);'
+    cloned = Cube(1, 1, 1).t(1, clone=True).t(2)
+    assert to_scad(cloned, multmatrix=True) == to_scad(cloned)
+    mirrored = Cube(1, 1, 1).t(1).mx(5, clone=True)
+    assert to_scad(mirrored, multmatrix=True) == (
+        'union(){translate([1,0,0])cube([1,1,1]);multmatrix([[-1,0,0,9],[0,1,0,0],[0,0,1,0],[0,0,0,1]])cube([1,1,1]);}'
+    )
+
+
+def test_multmatrix_not_longer_than_replaced_chain():
+    model = (Cube(1, 1, 1).t(1).rz(30) + Cube(2, 2, 2).rx(45, yc=1).t(3)).s(2, 2, 2)
+    composed = to_scad(model, multmatrix=True)
+    assert composed == to_scad(model)
+    assert 'multmatrix' not in composed
+
+    model = Cube(1, 1, 1).rz(30, xc=2, clone=True)
+    assert to_scad(model, multmatrix=True) == to_scad(model)
+
+
+def test_multmatrix_matches_transformed_origin():
+    from yaost.optimize import compose_affine
+
+    model = Cube(1, 2, 3).rotate(10, 20, 30, xc=1).s(2, 3, 4, zc=1).t(5, 6, 7).my(yc=2)
+    composed = compose_affine(model)
+    assert (composed.origin - model.origin).norm < 1e-9
+
+
+def test_multmatrix_keeps_variables():
+    model = Cube(1, 1, 1).rz(Variable('$t', 0)).t(1).t(2)
+    assert to_scad(model, multmatrix=True) == 'translate([3,0,0])rotate([0,0,$t])cube([1,1,1]);'
+    assert to_scad(Cube(1, 1, 1).t(Variable('x', 1)).rz(90), multmatrix=True) == (
+        'rotate([0,0,90])translate([x,0,0])cube([1,1,1]);'
+    )
+
+
+def test_bbox_through_transformations():
+    cube = Cube(2, 4, 6)
+    assert cube.rz(90).bbox.as_tuple() == (-4, 0, 0, 0, 2, 6)
+    assert cube.rz(45).rz(-45).bbox.as_tuple() == (0, 0, 0, 2, 4, 6)
+    assert cube.mx(5, clone=True).bbox.as_tuple() == (0, 0, 0, 10, 4, 6)
+    assert (cube + cube.t(10)).bbox.as_tuple() == (0, 0, 0, 12, 4, 6)
+    assert intersection(cube, cube.t(1, 1, 1)).bbox.as_tuple() == (1, 1, 1, 2, 4, 6)
+    assert intersection(cube, cube.t(10)).bbox.is_empty
+    assert (cube - cube.t(1)).bbox.as_tuple() == (0, 0, 0, 2, 4, 6)
+    assert Node('x').t(1).bbox.is_unknown
+
+    chain = cube
+    for _ in range(sys.getrecursionlimit() * 2):
+        chain = chain.t(1)
+    assert chain.bbox.vmin.x == sys.getrecursionlimit() * 2
+
+
+def test_bbox_of_deep_join_and_mixed_chains():
+    depth = sys.getrecursionlimit() * 2
+    cube = Cube(1, 1, 1)
+
+    joined = cube
+    for i in range(1, depth):
+        joined = joined.join(cube.t(i))
+    assert joined.bbox.as_tuple() == (0, 0, 0, depth, 1, 1)
+
+    mixed = cube
+    for _ in range(depth):
+        mixed = (mixed + cube).t(1).color('red')
+    assert mixed.bbox.as_tuple() == (1, 0, 0, depth + 1, 1, 1)
+
+
+def test_simplify_drops_booleans_without_effect():
+    plate = Cube(20, 20, 2)
+    hole = Cylinder(d=2, h=10).tz(-1)
+
+    model = plate - hole.t(5, 5) - hole.t(50, 50)
+    assert to_scad(model, simplify=True) == 'difference(){cube([20,20,2]);translate([5,5,-1])cylinder(d=2,h=10);}'
+    assert to_scad(plate - hole.t(50, 50), simplify=True) == 'cube([20,20,2]);'
+    assert to_scad(intersection(plate, plate.t(30)).t(1) + Cube(1, 1, 1), simplify=True) == 'cube([1,1,1]);'
+    assert to_scad(hull(Cube(1, 1, 1)), simplify=True) == 'hull()cube([1,1,1]);'
+    unknown = Node('x') - Node('y').t(100)
+    assert to_scad(unknown, simplify=True) == to_scad(unknown)
+
+
+def test_simplify_keeps_variable_holes():
+    model = Cube(10, 10, 10) - Cylinder(d=1, h=20).t(Variable('hole_x', 3), 1)
+    assert model.children[1].bbox.is_unknown
+    assert to_scad(model, simplify=True) == to_scad(model)
+
+
+def test_simplify_prunes_accumulated_holes():
+    plate = Cube(20, 20, 2)
+    holes = Cylinder(d=2, h=10).t(5, 5, -1)
+    for i in range(1, 10):
+        holes += Cylinder(d=2, h=10).t(50 * i, 5, -1)
+
+    model = plate - holes
+    assert to_scad(model, simplify=True) == 'difference(){cube([20,20,2]);translate([5,5,-1])cylinder(d=2,h=10);}'
+    assert to_scad(plate - holes.t(100), simplify=True) == 'cube([20,20,2]);'
+
+
+def test_simplify_keeps_holes_cut_by_join():
+    plate = Cube(20, 20, 2)
+    # hole does not touch the boss, but join cuts it from the plate too
+    boss = Cylinder(d=6, h=5).t(2, 2, 2) - Cylinder(d=2, h=20).t(10, 10, -5)
+    model = join(plate, boss)
+    assert to_scad(model, simplify=True) == to_scad(model)
+
+
+def test_long_union_chains():
+    depth = sys.getrecursionlimit() * 2
+
+    result = Cube(1, 1, 1)
+    for i in range(1, depth):
+        result += Cube(1, 1, 1).t(2 * i)
+    assert result.origin.x == depth - 0.5
+    assert result.bbox.as_tuple() == (0, 0, 0, 2 * depth - 1, 1, 1)
+    assert result.to_scad().count('cube(') == depth
+
+    # origin is mean of origins of flattened union members
+    model = (Cube(2, 2, 2) + Cube(2, 2, 2).t(4)).t(1, clone=True).rz(90) + Cube(2, 2, 2)
+    flat = list(model.collapse(Union, Hull))
+    assert len(flat) == 3
+    mean = sum((node.origin for node in flat), Vector()) / len(flat)
+    assert (model.origin - mean).norm < 1e-9
+
+
+def test_collapse_is_computed_once():
+    hole = (Node('x') + Node('y')).rz(30)
+    model = Node('a') - hole.t(1) - hole.t(2)
+
+    first = list(model.collapse(Difference))
+    assert list(model.collapse(Difference)) == first
+    assert all(a is b for a, b in zip(model.collapse(Difference), first))
+    assert list(hole.collapse(Union))[0] is list(hole.collapse(Union))[0]
+    assert model.to_scad() == model.to_scad()
+
+    # cached result of shared subtree is reused by parents
+    shared = list(hole.collapse(Union))
+    parent = list((hole + Node('z')).collapse(Union))
+    assert all(a is b for a, b in zip(parent, shared))
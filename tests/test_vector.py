@@ -1,3 +1,8 @@
+import pickle
+
+import pytest
+
+from yaost.bbox import BBox
 from yaost.vector import Vector
 
 
@@ -29,3 +34,33 @@ def test_projection():
             assert (ll - projection).norm <= (ll - v).norm
             assert (r - projection).norm <= (r - v).norm
             assert abs((v - projection).dot(ll - r)) < 10e-6
+
+
+def test_vectors_and_boxes_are_immutable():
+    v = Vector(1, 2, 3)
+    with pytest.raises(AttributeError):
+        v.x = 0
+    with pytest.raises(AttributeError):
+        v.w = 0
+    assert (1, 2, 3) == (v.x, v.y, v.z)
+
+    box = BBox(Vector(0, 0, 0), v)
+    with pytest.raises(AttributeError):
+        box.vmax = Vector()
+    assert box.vmax is v
+
+    copied = pickle.loads(pickle.dumps(box))
+    assert copied == box
+    assert (1, 2, 3) == (copied.vmax.x, copied.vmax.y, copied.vmax.z)
+
+
+def test_equal_boxes_have_equal_hashes():
+    box = BBox(Vector(0, 0, 0), Vector(1, 2, 3))
+    same = BBox(Vector(0, 0, 0), Vector(1, 2, 3))
+    empty = BBox(Vector(1, 0, 0), Vector(0, 1, 1))
+
+    assert box == same
+    assert hash(box) == hash(same)
+    assert empty == BBox.empty()
+    assert hash(empty) == hash(BBox.empty())
+    assert len({box, same, empty, BBox.empty()}) == 2